@@ -1,21 +1,14 @@
 import os
+import sys
+import mmap
+from array import array
+from collections import deque
 from timeit import default_timer as timer
-from datetime import timedelta
 
-import uuid
-import shortuuid
-import graphviz, tempfile
+from structures import Stack, Colors, ClosureCache, Traceable, Alphabet, to_bitset, from_bitset
 
-from structures import Stack, Colors
 
-
-os.environ["PATH"] += os.pathsep + 'C:\Program Files\Graphviz\bin'
-
-
-shortuuid.set_alphabet("0914856327")
-
-
-class FA(object):
+class FA(Traceable):
     """
     CLASS FA (Finite Automata)
     
@@ -24,90 +17,159 @@ class FA(object):
     Params:
         ->
     """
-    def __init__(self, symbols, states, tfunc, istate, tstate):
+    state_prefix = 'q'
+    
+    def __init__(self, symbols, states, tfunc, istate, tstate, sink=None):
         self.states = states
         self.symbols = symbols
         self.transition_function = tfunc
         self.initial_state = istate
         self.terminal_states = tstate
+        self.attach(sink)
+        
+        
+    def size(self):
+        transitions = sum(1 if isinstance(value, int) else len(value) for value in self.transition_function.values())
+        
+        return len(self.states), transitions
+        
+        
+    def emit_automata(self, phase, operation, automata, start=None):
+        states, transitions = automata.size()
+        
+        self.emit(phase, operation, start, states=states, transitions=transitions, automata=automata)
+        
+        
+    def state_name(self, state):
+        # states are dense integers, names are only built for humans
+        if isinstance(state, (list, tuple)):
+            return [self.state_name(x) for x in state]
+        
+        return self.state_prefix + str(state)
         
     
     def print_automata(self, type, i_state, t_state, states, symbols, t_function, state_mapping=None):
+        name = self.state_name
+        
         print(Colors.OKBLUE + "[INFO]" + Colors.ENDC + " NEW " + Colors.UNDERLINE + type + Colors.ENDC + " AUTOMATA CREATED WITH")
         print(Colors.OKCYAN + " INITIAL STATE" + Colors.ENDC)
-        print(" °", i_state)
+        print(" °", name(i_state))
         print(Colors.OKCYAN + " TERMINAL STATES" + Colors.ENDC)
-        print(" °", t_state)
+        print(" °", name(t_state))
         print(Colors.OKCYAN + " STATES" + Colors.ENDC)
         print(" °")
         for state in states:
-            print("     ", state)
+            print("     ", name(state))
         print(Colors.OKCYAN + " SYMBOLS" + Colors.ENDC)
         print(" °", symbols)
         if state_mapping:
             print(Colors.OKCYAN + " STATE MAPPING" + Colors.ENDC)
             print(" °")
             for key, value in state_mapping.items():
-                print("     ", key, "->", value)
+                key = tuple(sorted(key)) if isinstance(key, frozenset) else key
+                print("     ", key, "->", name(value))
         print(Colors.OKCYAN + " TRANSITIONS" + Colors.ENDC)
         print(" °")
         for key, value in t_function.items():
-            print("     ", key, "->", value)
+            print("     ", (name(key[0]), key[1]), "->", name(value))
         print("")
         
         
-    def graph_automata(self, mapping=None):
-        builder = graphviz.Digraph(graph_attr={'rankdir':'LR'})
+    def to_dot(self, **options):
+        # drawing is loaded on first use, the engine only imports the standard library
+        import graphs
         
-        for x in self.states:
-            x = x if not mapping else mapping[tuple(x)]
-            if x not in self.terminal_states:
-                builder.attr('node', shape='circle')
-                builder.node(x)
-            else:
-                builder.attr('node', shape='doublecircle')
-                builder.node(x)
-                
-        builder.attr('node', shape='none')
-        builder.node('')
-        builder.edge('', self.initial_state)
+        return graphs.to_dot(self, **options)
         
-        for key, value in self.transition_function.items():
-            if isinstance(value, str):
-                builder.edge(key[0], value, label=(key[1]))
-            else:
-                for val in value:
-                    builder.edge(key[0], val, label=(key[1]))
+                
+    def graph_automata(self, path=None, format=None, background=False, executor=None, **options):
+        # headless: returns the DOT text, or writes path (optionally in the background), no viewer is opened
+        import graphs
         
-        builder.view(tempfile.mktemp('.gv'), cleanup=True, )
+        return graphs.export(self, path, format, background, executor, **options)
         
         
     def simulate(self):
         raise Exception ("Not Implemented")
+    
+    
+    def matcher(self):
+        return StreamMatcher(self)
 
 
 
 
 class NFA(FA):
-    def __init__(self, symbols=None, syntax_tree=None, states=[], tfunc={}, istate=None, tstate=[]):
+    def __init__(self, symbols=None, syntax_tree=None, states=[], tfunc={}, istate=None, tstate=[], adjacency=None, cache_size=1024, lazy_budget=1 << 20, sink=None):
         self.syntax_tree = syntax_tree
+        self.cache_size = cache_size
+        self.lazy_budget = lazy_budget
+        self.closure_cache = None
+        self.classes = None
+        self.state_count = 0
+        self.engines = {}
         
         # instanciamos al objeto 
-        FA.__init__(self, symbols, states=states, tfunc=tfunc, istate=istate, tstate=tstate)
+        FA.__init__(self, symbols, states=states, tfunc=tfunc, istate=istate, tstate=tstate, sink=sink if sink is not None else syntax_tree and syntax_tree.sink)
+        
+        # per state index: state -> {symbol: [successors]}
+        self.adjacency = adjacency if adjacency is not None else self.index_transitions(states, tfunc)
+    
+    
+    @staticmethod
+    def index_transitions(states, t_function):
+        adjacency = {state: {} for state in states}
+        
+        # successor lists are shared with the transition function
+        for key, value in t_function.items():
+            try:
+                adjacency[key[0]][key[1]] = value
+            except:
+                adjacency[key[0]] = {key[1]: value}
+                
+        return adjacency
+    
+    
+    def new_state(self):
+        state = self.state_count
+        self.state_count += 1
+        
+        return state
+    
+    
+    def partition(self):
+        # equivalence classes of the input alphabet, each one knows the labels it follows
+        if self.classes is None:
+            self.classes = Alphabet.partition(self.symbols)
+            
+        return self.classes
+    
+    
+    def build_closure_cache(self):
+        # single state closures are filled on first use (precomputing all of them is 
+        # quadratic on long ε chains), set closures are memoized on demand
+        self.closure_cache = ClosureCache(self.cache_size)
+            
+        return self.closure_cache
 
 
     def thompson(self):
-        sym = self.syntax_tree.traverse_postorder(self.syntax_tree.root)
-        stack = Stack()
-        self.a_stack = Stack()
+        start = self.trace_start()
         
-        for i in range(len(sym) - 1, -1, -1):
-            stack.push(sym[i])
+        # every fragment is written into this shared store: state -> {symbol: [successors]}
+        self.adjacency = {}
+        self.alphabet = set()
+        self.state_count = 0
+        
+        # Thompson only needs the shape of the tree, positions and masks are never computed
+        nodes = self.syntax_tree.postorder(self.syntax_tree.root)
+        self.a_stack = Stack()
             
-        while not stack.is_empty():
-            nxt = stack.pop()
+        for node in nodes:
+            nxt = node.data
             
-            if nxt in self.symbols:
+            # leaves are symbols, even an escaped operator character
+            if node.left is None and node.right is None:
                 new_automata = self.SYMBOL(nxt)
                 self.a_stack.push(new_automata)
             else:
@@ -120,9 +182,8 @@ class NFA(FA):
                     
                 elif nxt == '+':
                     a = self.a_stack.pop()
-                    b = self.KLEENE(a, new_names=True)
                     
-                    new_automata = self.CONCAT(a, b)
+                    new_automata = self.PLUS(a)
                     self.a_stack.push(new_automata)
                 
                 elif nxt == '*':
@@ -151,332 +212,855 @@ class NFA(FA):
         final_automata = self.a_stack.pop()
         self.initial_state = final_automata.initial_state
         self.terminal_states = final_automata.terminal_states
-        self.states = final_automata.states
-        self.symbols = final_automata.symbols
-        self.transition_function = final_automata.transition_function
+        self.states = list(self.adjacency)
+        self.symbols = list(self.alphabet)
+        self.classes = None
+        self.engines = {}
+        
+        # the transition table shares its successor lists with the store
+        self.transition_function = {
+            (state, symbol): value 
+            for state, edges in self.adjacency.items() 
+            for symbol, value in edges.items()
+        }
+        
+        self.build_closure_cache()
+        
+        self.sink is not None and self.tally('thompson', fragments=len(nodes))
+        self.sink is not None and self.emit_automata('thompson', 'NFA', self, start)
                 
     
     def SYMBOL(self, symbol):
+        start = self.trace_start()
+        
         # generate id's for the initial and terminal states
-        i_state = shortuuid.encode(uuid.uuid4())[:4]
-        t_state = shortuuid.encode(uuid.uuid4())[:4]
+        i_state = self.new_state()
+        t_state = self.new_state()
         
-        # states list
-        states = [i_state, t_state]
+        self.adjacency[i_state] = {symbol: [t_state]}
+        self.adjacency[t_state] = {}
+        self.alphabet.add(symbol)
         
-        # transition_function
-        t_function = {
-            (i_state, symbol): [t_state]
-        }
+        fragment = Fragment(self.adjacency, i_state, t_state, 2, 1)
         
-        #symbols
-        symbols = list(symbol)
+        self.sink is not None and self.emit_automata('thompson', 'SYMBOL', fragment, start)
         
-        self.print_automata("SYMBOL", i_state, t_state, states, symbols, t_function)
-        
-        return NFA(symbols, states=states, tfunc=t_function, istate=i_state, tstate=[t_state])
+        return fragment
     
     
     def CONCAT(self, a, b):
-        # generate id's for the initial and terminal states
-        i_state = a.initial_state
-        t_state = b.terminal_states
+        start = self.trace_start()
         
-        # union of both a's and b's sets of symbols
-        symbols = list(set(a.symbols + b.symbols))
+        # a's final state becomes b's initial state: it takes over b's outgoing 
+        # transitions (b's initial state has no incoming ones)
+        self.adjacency[a.end] = self.adjacency.pop(b.initial_state)
         
-        # create intermediate state for merging a's final and b's initial state
-        intermediate_state = shortuuid.encode(uuid.uuid4())[:4]
+        fragment = Fragment(self.adjacency, a.initial_state, b.end, a.n_states + b.n_states - 1, a.n_transitions + b.n_transitions)
         
-        # transition function (a's final state and b's initial state become on)
-        t_function = dict(list(a.transition_function.items()) + list(b.transition_function.items()))
-        
-        for key, value in list(t_function.items()):
-            if key[0] == b.initial_state: 
-                t_function[(intermediate_state, key[1])] = value
-                del t_function[key]
-            
-            for fstate in a.terminal_states:
-                if fstate in value:
-                    t_function[key] = [intermediate_state if x == fstate else x for x in value]
+        self.sink is not None and self.emit_automata('thompson', 'CONCAT', fragment, start)
         
-        # new set of states with the merge done
-        states = [x for x in b.states if x != b.initial_state] + [x for x in a.states if x not in a.terminal_states] + [intermediate_state]
+        return fragment
     
-        self.print_automata("CONCAT", i_state, t_state, states, symbols, t_function)    
-    
-        return NFA(symbols=symbols, states=states, tfunc=t_function, istate=i_state, tstate=t_state)
     
     def OR(self, a, b):
-        # generate id's for the initial and terminal states
-        i_state = shortuuid.encode(uuid.uuid4())[:4]
-        t_state = shortuuid.encode(uuid.uuid4())[:4]
-        
-        # union of both a's and b's sets of symbols
-        symbols = list(set(a.symbols + b.symbols))
+        start = self.trace_start()
         
-        # transition function 
-        t_function = dict(list(a.transition_function.items()) + list(b.transition_function.items()))
+        # generate id's for the initial and terminal states
+        i_state = self.new_state()
+        t_state = self.new_state()
         
-        # append a's states, b's states, and new initial and terminal state
-        states = a.states + b.states + [i_state] + [t_state]
+        # new initial state to both initial states, both final states to the new final state
+        self.adjacency[i_state] = {'ε': [a.initial_state, b.initial_state]}
+        self.adjacency[t_state] = {}
+        self.adjacency[a.end]['ε'] = [t_state]
+        self.adjacency[b.end]['ε'] = [t_state]
         
-        # add new transition, create list if is the first one (a)
-        try: 
-            t_function[(i_state, 'ε')].append(a.initial_state)
-        except: 
-            t_function[(i_state, 'ε')] = [a.initial_state]
-            
-        # add new transition, create list if is the first one (b)
-        try: 
-            t_function[(i_state, 'ε')].append(b.initial_state)
-        except: 
-            t_function[(i_state, 'ε')] = [b.initial_state]
+        fragment = Fragment(self.adjacency, i_state, t_state, a.n_states + b.n_states + 2, a.n_transitions + b.n_transitions + 4)
         
-        # add new transition from (a) final states to new final state
-        for fstate in a.terminal_states:
-            try: 
-                t_function[(fstate, 'ε')].append(t_state)
-            except: 
-                t_function[(fstate, 'ε')] = [t_state]
-                
-        # add new transition from (b) final states to new final state
-        for fstate in b.terminal_states:
-            try: 
-                t_function[(fstate, 'ε')].append(t_state)
-            except: 
-                t_function[(fstate, 'ε')] = [t_state]
-                
-                
-        self.print_automata("OR", i_state, t_state, states, symbols, t_function)
+        self.sink is not None and self.emit_automata('thompson', 'OR', fragment, start)
         
-        return NFA(symbols=symbols, states=states, tfunc=t_function, istate=i_state, tstate=[t_state])
+        return fragment
         
     
-    def KLEENE(self, a, new_names=False):
-        # generate id's for the initial and terminal states
-        i_state = shortuuid.encode(uuid.uuid4())[:4]
-        t_state = shortuuid.encode(uuid.uuid4())[:4]
+    def KLEENE(self, a):
+        start = self.trace_start()
         
-        mirror_states = [shortuuid.encode(uuid.uuid4())[:4] for state in a.states] if new_names else a.states
+        # generate id's for the initial and terminal states
+        i_state = self.new_state()
+        t_state = self.new_state()
         
-        state_mapping = {}
+        # new initial state to new final state (accept ε cases) and to old initial state,
+        # old final state to new final state and back to old initial state
+        self.adjacency[i_state] = {'ε': [t_state, a.initial_state]}
+        self.adjacency[t_state] = {}
+        self.adjacency[a.end]['ε'] = [t_state, a.initial_state]
         
-        for i in range(len(mirror_states)):
-            state_mapping[a.states[i]] = mirror_states[i]
+        fragment = Fragment(self.adjacency, i_state, t_state, a.n_states + 2, a.n_transitions + 4)
         
-        # states list
-        states = [i_state, t_state] + mirror_states
+        self.sink is not None and self.emit_automata('thompson', 'KLEENE', fragment, start)
         
-        # copy symbols list
-        symbols = a.symbols
+        return fragment
+    
+    
+    def PLUS(self, a):
+        start = self.trace_start()
         
-        # copy transition function
-        t_function = {}
-        for key, value in list(a.transition_function.items()):
-            t_function[(state_mapping[key[0]], key[1])] = [state_mapping[val] for val in value]
-            
-        # add transitions for: 
-        # new initial state to new final state (accept ε cases) 
-        try: 
-            t_function[(i_state, 'ε')].append(t_state)
-        except: 
-            t_function[(i_state, 'ε')] = [t_state]
-            
-        # from new initial state to old initial state
-        try: 
-            t_function[(i_state, 'ε')].append(state_mapping[a.initial_state])
-        except: 
-            t_function[(i_state, 'ε')] = [state_mapping[a.initial_state]]
+        # like KLEENE without the ε bypass, so a is not copied
+        i_state = self.new_state()
+        t_state = self.new_state()
         
-        # from old terminal states to new terminal state
-        for fstate in a.terminal_states:
-            try: 
-                t_function[(state_mapping[fstate], 'ε')].append(t_state)
-            except: 
-                t_function[(state_mapping[fstate], 'ε')] = [t_state]
-                
-        # and the recursive transition from old terminal states to old initial state
-        for fstate in a.terminal_states:
-            try: 
-                t_function[(state_mapping[fstate], 'ε')].append(state_mapping[a.initial_state])
-            except: 
-                t_function[(state_mapping[fstate], 'ε')] = [state_mapping[a.initial_state]]
+        self.adjacency[i_state] = {'ε': [a.initial_state]}
+        self.adjacency[t_state] = {}
+        self.adjacency[a.end]['ε'] = [t_state, a.initial_state]
         
+        fragment = Fragment(self.adjacency, i_state, t_state, a.n_states + 2, a.n_transitions + 3)
         
-        self.print_automata("KLEENE", i_state, t_state, states, symbols, t_function)
+        self.sink is not None and self.emit_automata('thompson', 'PLUS', fragment, start)
         
-        return NFA(symbols=symbols, states=states, tfunc=t_function, istate=i_state, tstate=[t_state])
+        return fragment
     
     
-    def simulate(self, string):
+    def engine(self, name):
+        # simulation engines are built once and reused
+        try:
+            return self.engines[name]
+        except KeyError:
+            pass
+        
+        if name == 'bitset':
+            engine = BitParallelNFA(self)
+        elif name == 'lazy':
+            engine = LazyDFA(self, self.lazy_budget)
+        else:
+            raise ValueError("Unknown simulation engine: " + name)
+        
+        self.engines[name] = engine
+        
+        return engine
+    
+    
+    def simulate(self, string, engine='set'):
+        if engine != 'set':
+            start = timer()
+            
+            simulator = self.engine(engine)
+            hits, misses = getattr(simulator, 'hits', 0), getattr(simulator, 'misses', 0)
+            
+            try:
+                terminal = simulator.accepts(string)
+            except KeyError as e:
+                print(Colors.FAIL + "[ERROR] " + Colors.ENDC + " Símbolo " + e.args[0] + " no reconocido por el autómata")
+                terminal = None
+                
+            end = timer()
+            
+            engine == 'lazy' and self.sink is not None and self.tally('simulate', cache_hits=simulator.hits - hits, cache_misses=simulator.misses - misses)
+            self.sink is not None and self.emit('simulate', 'NFA ' + engine, start, length=len(string), accepted=terminal)
+            
+            return ((end-start) * 1000, terminal if terminal is None else "YES ^_^" if terminal else "NO... O_o")
+        
         start = timer()
         
-        S = DFA.e_closure_state(self, self.initial_state, self.transition_function)
+        tracing = self.sink is not None
+        hits = self.closure_cache.hits if self.closure_cache is not None else 0
+        moves = visited = 0
+        
+        S = DFA.e_closure_state(self, self.initial_state, self.adjacency, self.closure_cache)
         
         terminal = False
         
+        classes = self.partition()
+        
         for char in string:
-            if char not in self.symbols:
+            c = classes.get(char)
+            
+            if c is None:
                 print(Colors.FAIL + "[ERROR] " + Colors.ENDC + " Símbolo " + char + " no reconocido por el autómata")
                 terminal = None
                 break
                 exit()
             
-            S = DFA.e_closure_set(self, DFA.move(self, S, char, self.transition_function), self.transition_function)
+            if tracing:
+                moves += 1
+                visited += len(S)
+            
+            S = DFA.e_closure_set(self, DFA.move(self, S, char, self.adjacency, classes.members[c]), self.adjacency, self.closure_cache)
         
+        # an unknown symbol rejects, even if the prefix read so far was accepted
         for state in S:
-            if state in self.terminal_states: terminal = True
+            if state in self.terminal_states and terminal is not None: terminal = True
             
         end = timer()
         
+        if tracing:
+            self.tally('simulate', closure_calls=moves + 1, move_calls=moves, states_visited=visited + len(S), cache_hits=self.closure_cache.hits - hits if self.closure_cache is not None else 0)
+            self.emit('simulate', 'NFA set', start, length=len(string), accepted=terminal)
+        
         return ((end-start) * 1000, terminal if terminal is None else "YES ^_^" if terminal else "NO... O_o")
 
 
 
 
+class Fragment(FA):
+    """
+    CLASS FRAGMENT
+    
+    Fragmento de un NFA de Thompson dentro del almacén compartido del constructor.
+    Se identifica por su estado inicial y su único estado final, que no tiene
+    transiciones de salida (la salida pendiente que CONCAT, OR y KLEENE parchan en O(1)).
+    Los estados y transiciones del fragmento solo se recorren si alguien los pide.
+    
+    Params:
+        -> store (dict): almacén compartido state -> {symbol: [successors]}
+        -> start (int): estado inicial
+        -> end (int): estado final
+        -> n_states (int): cantidad de estados del fragmento
+        -> n_transitions (int): cantidad de transiciones del fragmento
+    """
+    def __init__(self, store, start, end, n_states, n_transitions):
+        self.store = store
+        self.initial_state = start
+        self.end = end
+        self.n_states = n_states
+        self.n_transitions = n_transitions
+        
+        
+    @property
+    def terminal_states(self):
+        return [self.end]
+    
+    
+    @property
+    def states(self):
+        states = [self.initial_state]
+        seen = {self.initial_state}
+        
+        for state in states:
+            for value in self.store[state].values():
+                for x in value:
+                    if x not in seen:
+                        seen.add(x)
+                        states.append(x)
+                        
+        return states
+    
+    
+    @property
+    def transition_function(self):
+        return {(state, symbol): value for state in self.states for symbol, value in self.store[state].items()}
+    
+    
+    @property
+    def symbols(self):
+        return list({symbol for state in self.states for symbol in self.store[state]})
+    
+    
+    def size(self):
+        return self.n_states, self.n_transitions
+
+
+
+
+class BitParallelNFA(object):
+    """
+    CLASS BIT PARALLEL NFA
+    
+    Motor de simulación de un NFA de Thompson donde el conjunto de estados activos
+    es un entero (bitmask). Los estados se numeran 0..n-1 y para cada símbolo se
+    precalcula la máscara de sucesores (ya cerrada bajo ε) de cada estado. Un paso
+    combina esas máscaras por bloques de 8 bits con tablas que se llenan bajo demanda,
+    así cada caracter cuesta ceil(n / 8) operaciones sobre enteros.
+    
+    Params:
+        -> nfa (NFA): autómata construido con thompson()
+    """
+    chunk = 8
+    
+    def __init__(self, nfa):
+        self.ids = {state: i for i, state in enumerate(nfa.states)}
+        self.n_states = len(nfa.states)
+        
+        closure = [
+            to_bitset(self.ids[x] for x in DFA.e_closure_state(nfa, state, nfa.adjacency, nfa.closure_cache))
+            for state in nfa.states
+        ]
+        
+        self.initial = closure[self.ids[nfa.initial_state]]
+        self.accepting = to_bitset(self.ids[state] for state in nfa.terminal_states)
+        
+        # successors[c][i]: ε-closed successor mask of state i on symbol class c
+        self.symbol_ids = nfa.partition()
+        self.successors = []
+        
+        for labels in self.symbol_ids.members:
+            masks = [0] * self.n_states
+            for state, edges in nfa.adjacency.items():
+                for label in labels:
+                    for x in edges.get(label, []):
+                        masks[self.ids[state]] |= closure[self.ids[x]]
+            
+            self.successors.append(masks)
+        
+        blocks = (self.n_states + self.chunk - 1) // self.chunk
+        self.tables = [[[None] * (1 << self.chunk) for _ in range(blocks)] for _ in self.successors]
+        
+        
+    def nbytes(self):
+        masks = sum(sys.getsizeof(mask) for masks in self.successors for mask in masks)
+        tables = sum(sys.getsizeof(table) for tables in self.tables for table in tables)
+        
+        return masks + tables
+        
+        
+    def fill(self, c, block, bits):
+        table = self.tables[c][block]
+        entry = table[bits]
+        
+        if entry is None:
+            low = bits & -bits
+            entry = self.successors[c][block * self.chunk + low.bit_length() - 1]
+            
+            if bits != low:
+                entry |= self.fill(c, block, bits ^ low)
+                
+            table[bits] = entry
+            
+        return entry
+    
+    
+    def step(self, active, c):
+        tables = self.tables[c]
+        mask = (1 << self.chunk) - 1
+        
+        result = 0
+        block = 0
+        
+        while active:
+            bits = active & mask
+            
+            if bits:
+                entry = tables[block][bits]
+                result |= entry if entry is not None else self.fill(c, block, bits)
+                
+            active >>= self.chunk
+            block += 1
+            
+        return result
+    
+    
+    def accepts(self, string):
+        active = self.initial
+        symbol_ids = self.symbol_ids
+        
+        for char in string:
+            active = self.step(active, symbol_ids[char])
+            
+            if not active:
+                break
+            
+        return bool(active & self.accepting)
+
+
+
+
+class LazyDFA(object):
+    """
+    CLASS LAZY DFA
+    
+    DFA construido sobre la marcha mientras se simula el NFA. Cada estado es la
+    máscara de estados activos del motor bitset, y cada transición (estado, símbolo)
+    se determiniza una sola vez y queda guardada. Si la memoria estimada supera el
+    presupuesto, la caché se vacía y el resto de la entrada se simula por conjuntos.
+    
+    Params:
+        -> nfa (NFA): autómata construido con thompson()
+        -> memory_budget (int): bytes máximos estimados para la caché de estados
+    """
+    def __init__(self, nfa, memory_budget=1 << 20):
+        self.engine = nfa.engine('bitset')
+        self.memory_budget = memory_budget
+        self.k = len(self.engine.successors)
+        
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        
+        self.flush()
+        
+        
+    def flush(self):
+        self.states = {}
+        self.memory = 0
+        self.initial = self.record(self.engine.initial)
+        
+        
+    def record(self, mask):
+        # state record: [mask, accepting, next state for each symbol...]
+        state = self.states.get(mask)
+        
+        if state is None:
+            state = [mask, bool(mask & self.engine.accepting)] + [None] * self.k
+            self.states[mask] = state
+            self.memory += sys.getsizeof(state) + sys.getsizeof(mask) + 64
+            
+        return state
+    
+    
+    def accepts(self, string):
+        symbol_ids = self.engine.symbol_ids
+        state = self.initial
+        
+        for i, char in enumerate(string):
+            c = symbol_ids[char] + 2
+            target = state[c]
+            
+            if target is None:
+                self.misses += 1
+                mask = self.engine.step(state[0], c - 2)
+                
+                if self.memory > self.memory_budget:
+                    self.flushes += 1
+                    self.flush()
+                    
+                    return self.fallback(mask, string, i + 1)
+                
+                target = state[c] = self.record(mask)
+            else:
+                self.hits += 1
+                
+            state = target
+            
+            if not state[0]:
+                break
+            
+        return state[1]
+    
+    
+    def fallback(self, active, string, start):
+        symbol_ids = self.engine.symbol_ids
+        
+        # set simulation for the rest of the input, nothing is cached
+        for i in range(start, len(string)):
+            if not active:
+                break
+            
+            active = self.engine.step(active, symbol_ids[string[i]])
+            
+        return bool(active & self.engine.accepting)
+    
+    
+    def info(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'flushes': self.flushes,
+            'states': len(self.states),
+            'memory': self.memory,
+            'memory_budget': self.memory_budget,
+        }
+
+
+
+
 class DFA(FA):
-    def __init__(self, nfa=None, syntax_tree=None, symbols=None, states=[], tfunc={}, istate=None, tstate=[], direct=False, nodes=None):
+    state_prefix = 'S'
+    
+    def __init__(self, nfa=None, syntax_tree=None, symbols=None, states=[], tfunc={}, istate=None, tstate=[], direct=False, nodes=None, sink=None, markers=None):
         self.syntax_tree = syntax_tree
         self.nfa = nfa
         self.nodes = nodes
         self.state_mapping = None
+        self.compiled = None
+        
+        # end markers for the direct method: marker symbol -> token (lower wins)
+        self.markers = markers if markers is not None else {'#': 0}
+        self.tokens = None
+        
+        # construction traces go to the same sink as the source automata or tree
+        if sink is None and (nfa or syntax_tree):
+            sink = (nfa or syntax_tree).sink
         
         # remove 'ε' from symbols (affects construction)
         nfa and 'ε' in nfa.symbols and nfa.symbols.remove('ε')
         syntax_tree and 'ε' in syntax_tree.symbols and syntax_tree.symbols.remove('ε')
         
+        # construction runs over symbol classes, end markers are not part of the input
+        self.classes = None
+        
+        if symbols is None:
+            self.classes = nfa.partition() if nfa else syntax_tree.partition(exclude=self.markers)
+            symbols = self.classes.labels
+        
         # instanciamos al objeto 
         FA.__init__(
             self, 
-            symbols=nfa.symbols if nfa else syntax_tree.symbols,
+            symbols=symbols,
             states=states, 
             tfunc=tfunc,
             istate=istate, 
-            tstate=tstate
+            tstate=list(tstate),
+            sink=sink
         )
         
     
     def follow_pos(self):
+        # followpos as bitsets: bit p is set when position p follows
         self.followpos = {}
         
         for node in self.nodes:
             if node.pos:
-                self.followpos[node.pos] = []
+                self.followpos[node.pos] = 0
             
         for node in self.nodes:
+            # leaves can hold an escaped operator character, only inner nodes count
+            if node.right is None:
+                continue
+            
             if node.data == '^':
+                first = node.right.firstmask
                 for i in node.left.lastpos:
-                    self.followpos[i] += node.right.firstpos
+                    self.followpos[i] |= first
                     
-            if node.data == '*':
+            # a+ loops back like a*, its lastpos is followed by its firstpos
+            if node.data == '*' or node.data == '+':
+                first = node.firstmask
                 for i in node.lastpos:
-                    self.followpos[i] += node.firstpos
+                    self.followpos[i] |= first
     
     
-    def direct(self):
+    def symbol_positions(self):
+        positions = {symbol: 0 for symbol in self.symbols}
+        
+        # leaves only, each class maps to the bitset of the positions whose label covers it
+        covers = self.classes.covers
+        
+        for node in self.nodes:
+            if node.pos and node.data in covers:
+                for c in covers[node.data]:
+                    positions[self.symbols[c]] |= 1 << node.pos
+                
+        return positions
+    
+    
+    def direct(self, minimize=False):
+        start = self.trace_start()
+        
         self.follow_pos()
         
-        print(self.followpos)
+        self.sink is not None and self.emit('direct', 'followpos', start, followpos={pos: from_bitset(mask) for pos, mask in self.followpos.items()})
         
-        final_pos = 0
+        token_masks = {}
         
         for node in self.nodes:
-            if node.data == '#':
-                final_pos = node.pos
+            if node.pos and node.data in self.markers:
+                token = self.markers[node.data]
+                token_masks[token] = token_masks.get(token, 0) | 1 << node.pos
+        
+        token_masks = sorted(token_masks.items())
+        
+        followpos = self.followpos
+        positions = self.symbol_positions()
 
         t_func = {}
-        subset_mapping = {}
         
-        dstates_u = [self.syntax_tree.root.firstpos]
-        dstates_m = []
+        # interning table: position bitset -> dense DFA id
+        initial = self.syntax_tree.root.firstmask
+        interned = {initial: 0}
+        dstates_m = [initial]
         
-        while len(dstates_u) > 0:
-            T = dstates_u.pop(0)
-            dstates_m.append(T)
+        worklist = deque([0])
+        
+        while worklist:
+            i = worklist.popleft()
+            T = dstates_m[i]
             
             for symbol in self.symbols:
-                U = []
-                for node in self.nodes:
-                    if node.data == symbol and node.pos in T:
-                        U += self.followpos[node.pos]
-                        U = list(set(U))
+                hits = T & positions[symbol]
+                U = 0
                 
-                if len(U) > 0:
-                    if U not in dstates_u and U not in dstates_m:
-                        dstates_u.append(U)
-                        
-                    try: 
-                        subset_mapping[tuple(T)]
-                    except:
-                        subset_mapping[tuple(T)] = shortuuid.encode(uuid.uuid4())[:4]
-                        
-                    try:
-                        subset_mapping[tuple(U)]
-                    except:
-                        subset_mapping[tuple(U)] = shortuuid.encode(uuid.uuid4())[:4]
-                        
+                # OR the followpos of every position of T labelled with symbol
+                while hits:
+                    low = hits & -hits
+                    U |= followpos[low.bit_length() - 1]
+                    hits ^= low
+                
+                if U:
+                    j = interned.get(U)
                     
-                    t_func[(subset_mapping[tuple(T)], symbol)] = subset_mapping[tuple(U)]                        
-
-        for state in dstates_m:
-            if final_pos in state:
-                self.terminal_states.append(subset_mapping[tuple(state)])
+                    if j is None:
+                        j = len(dstates_m)
+                        interned[U] = j
+                        dstates_m.append(U)
+                        worklist.append(j)
+                    
+                    t_func[(i, symbol)] = j
 
-        self.initial_state = subset_mapping[tuple(dstates_m[0])]
-        self.states = dstates_m
+        # each accepting state keeps the token of its highest priority marker
+        self.tokens = {}
+        
+        for i, state in enumerate(dstates_m):
+            for token, mask in token_masks:
+                if state & mask:
+                    self.tokens[i] = token
+                    break
+        
+        self.terminal_states = list(self.tokens)
+        self.initial_state = 0
+        self.states = list(range(len(dstates_m)))
         self.transition_function = t_func
-        self.state_mapping = subset_mapping
+        self.state_mapping = {tuple(from_bitset(state)): i for i, state in enumerate(dstates_m)}
+        self.compiled = None
+        
+        self.sink is not None and self.tally('direct', states_visited=len(dstates_m), transitions=len(t_func))
         
-        self.print_automata("DIRECT DFA", self.initial_state, self.terminal_states, self.states, self.symbols, self.transition_function, state_mapping=subset_mapping)
+        minimize and self.adopt(self.minimize())
+        
+        self.sink is not None and self.emit_automata('direct', 'DIRECT DFA', self, start)
     
     
-    def subset(self):
+    def subset(self, minimize=False):
+        start = self.trace_start()
         t_func = {}
-        subset_mapping = {}
         
-        dstates_u = [self.e_closure_state(self.nfa.initial_state, self.nfa.transition_function)]
-        dstates_m = []
+        cache = self.nfa.closure_cache
+        hits = cache.hits if cache is not None else 0
+        members = self.classes.members
+        adjacency = self.nfa.adjacency
+        
+        # interning table: NFA state set -> dense DFA id (order insensitive)
+        initial = self.e_closure_state(self.nfa.initial_state, adjacency, cache)
+        subset_mapping = {frozenset(initial): 0}
+        dstates_m = [initial]
+        
+        worklist = deque([0])
         
-        while len(dstates_u) > 0:
-            T = dstates_u.pop(0)
-            dstates_m.append(T)
+        while worklist:
+            i = worklist.popleft()
+            T = dstates_m[i]
             
-            for symbol in self.symbols:
-                U = self.e_closure_set(self.move(T, symbol, self.nfa.transition_function), self.nfa.transition_function)
+            for c, symbol in enumerate(self.symbols):
+                U = self.e_closure_set(self.move(T, symbol, adjacency, members[c]), adjacency, cache)
                 
                 if len(U) > 0:
-                    if U not in dstates_u and U not in dstates_m:
-                        dstates_u.append(U)
+                    key = frozenset(U)
+                    j = subset_mapping.get(key)
                     
-                    try: 
-                        subset_mapping[tuple(T)]
-                    except:
-                        subset_mapping[tuple(T)] = shortuuid.encode(uuid.uuid4())[:4]
-                        
-                    try:
-                        subset_mapping[tuple(U)]
-                    except:
-                        subset_mapping[tuple(U)] = shortuuid.encode(uuid.uuid4())[:4]
+                    if j is None:
+                        j = len(dstates_m)
+                        subset_mapping[key] = j
+                        dstates_m.append(U)
+                        worklist.append(j)
 
-                    t_func[(subset_mapping[tuple(T)], symbol)] = subset_mapping[tuple(U)]
-                    
+                    t_func[(i, symbol)] = j
         
-        for states in dstates_m:
-            for state in states:
-                if state in self.nfa.terminal_states:
-                    self.terminal_states.append(subset_mapping[tuple(states)])
+        nfa_terminals = set(self.nfa.terminal_states)
+        self.terminal_states = [i for i, states in enumerate(dstates_m) if not nfa_terminals.isdisjoint(states)]
                 
-        self.initial_state = subset_mapping[tuple(dstates_m[0])]
-        self.states = dstates_m 
+        self.initial_state = 0
+        self.states = list(range(len(dstates_m)))
         self.transition_function = t_func
         self.state_mapping = subset_mapping
+        self.compiled = None
+        
+        # one move and one closure per (state, symbol) pair, derived after the loop
+        if self.sink is not None:
+            k = len(self.symbols)
+            self.tally(
+                'subset', 
+                closure_calls=len(dstates_m) * k + 1, 
+                move_calls=len(dstates_m) * k, 
+                states_visited=sum(len(T) for T in dstates_m) * k, 
+                cache_hits=cache.hits - hits if cache is not None else 0
+            )
+        
+        minimize and self.adopt(self.minimize())
+        
+        self.sink is not None and self.emit_automata('subset', 'DFA', self, start)
+    
+    
+    def minimize(self):
+        start = self.trace_start()
+        
+        ids = {state: i for i, state in enumerate(self.states)}
+        columns = {symbol: i for i, symbol in enumerate(self.symbols)}
+        
+        n = len(self.states)
+        k = len(self.symbols)
+        dead = n
+        
+        # inverse transitions per symbol, missing transitions go to the dead state
+        delta = [[dead] * k for _ in range(n + 1)]
+        for (state, symbol), target in self.transition_function.items():
+            delta[ids[state]][columns[symbol]] = ids[target]
+            
+        inverse = [[[] for _ in range(n + 1)] for _ in range(k)]
+        for q in range(n + 1):
+            for c in range(k):
+                inverse[c][delta[q][c]].append(q)
+        
+        # initial partition: non accepting states, and accepting states by token
+        accepting = {ids[state] for state in self.terminal_states}
+        tokens = self.tokens or {}
+        
+        labels = [None] * (n + 1)
+        for state in self.terminal_states:
+            labels[ids[state]] = tokens.get(state, -1)
+            
+        groups = {}
+        for q in range(n + 1):
+            groups.setdefault(labels[q], set()).add(q)
+        blocks = list(groups.values())
+        
+        block_of = [0] * (n + 1)
+        for b, block in enumerate(blocks):
+            for q in block:
+                block_of[q] = b
+        
+        # Hopcroft's partition refinement, always queueing the smaller half
+        largest = max(range(len(blocks)), key=lambda b: len(blocks[b]))
+        waiting = {(b, c) for b in range(len(blocks)) if b != largest for c in range(k)}
+        waiting_list = list(waiting)
+        
+        while waiting_list:
+            splitter = waiting_list.pop()
+            waiting.discard(splitter)
+            
+            b, c = splitter
+            predecessors = set()
+            for q in blocks[b]:
+                predecessors.update(inverse[c][q])
+                
+            touched = {}
+            for q in predecessors:
+                touched.setdefault(block_of[q], set()).add(q)
+                
+            for y, inside in touched.items():
+                if len(inside) == len(blocks[y]):
+                    continue
+                
+                new = len(blocks)
+                blocks[y] -= inside
+                blocks.append(inside)
+                for q in inside:
+                    block_of[q] = new
+                
+                for a in range(k):
+                    if (y, a) in waiting:
+                        pending = (new, a)
+                    else:
+                        pending = (new, a) if len(inside) <= len(blocks[y]) else (y, a)
+                        
+                    waiting.add(pending)
+                    waiting_list.append(pending)
+        
+        # renumber the surviving blocks in BFS order, dropping the dead block
+        initial = block_of[ids[self.initial_state]]
+        numbering = {}
         
-        self.print_automata("DFA", self.initial_state, self.terminal_states, self.states, self.symbols, self.transition_function, state_mapping=subset_mapping)
+        if initial != block_of[dead]:
+            numbering[initial] = 0
+            queue = deque([initial])
+            
+            while queue:
+                b = queue.popleft()
+                q = next(iter(blocks[b]))
+                
+                for c in range(k):
+                    target = block_of[delta[q][c]]
+                    if target != block_of[dead] and target not in numbering:
+                        numbering[target] = len(numbering)
+                        queue.append(target)
+        
+        t_func = {}
+        for b, state in numbering.items():
+            q = next(iter(blocks[b]))
+            
+            for c in range(k):
+                target = block_of[delta[q][c]]
+                if target in numbering:
+                    t_func[(state, self.symbols[c])] = numbering[target]
+        
+        t_states = sorted(numbering[b] for b in numbering if next(iter(blocks[b])) in accepting)
+        
+        minimal = DFA(
+            nfa=self.nfa, 
+            syntax_tree=self.syntax_tree, 
+            symbols=self.symbols, 
+            states=list(range(max(len(numbering), 1))), 
+            tfunc=t_func, 
+            istate=0, 
+            tstate=t_states, 
+            nodes=self.nodes,
+            markers=self.markers
+        )
+        
+        if self.tokens is not None:
+            minimal.tokens = {numbering[b]: labels[next(iter(blocks[b]))] for b in numbering if next(iter(blocks[b])) in accepting}
+        
+        # every old subset now points to its equivalence class
+        if self.state_mapping is not None:
+            minimal.state_mapping = {
+                key: numbering[block_of[ids[value]]] 
+                for key, value in self.state_mapping.items() 
+                if block_of[ids[value]] in numbering
+            }
+        
+        if self.sink is not None:
+            self.tally('minimize', splits=len(blocks) - len(groups))
+            self.emit('minimize', 'minimize', start, states=len(minimal.states), transitions=len(t_func))
+        
+        return minimal
+    
     
+    def adopt(self, dfa):
+        self.states = dfa.states
+        self.transition_function = dfa.transition_function
+        self.initial_state = dfa.initial_state
+        self.terminal_states = dfa.terminal_states
+        self.state_mapping = dfa.state_mapping
+        self.tokens = dfa.tokens
+        self.compiled = None
     
-    def e_closure_state(self, s, transition_function):
+    
+    def compile(self):
+        columns = {symbol: i for i, symbol in enumerate(self.symbols)}
+        ids = {state: i for i, state in enumerate(self.states)}
+        
+        n = len(self.states)
+        k = len(self.symbols)
+        
+        # row n is the dead state, every missing transition goes there
+        table = array('i', [n]) * ((n + 1) * k)
+        
+        for (state, symbol), target in self.transition_function.items():
+            table[ids[state] * k + columns[symbol]] = ids[target]
+            
+        accepting = bytearray(n + 1)
+        for state in self.terminal_states:
+            accepting[ids[state]] = 1
+        
+        # token of every state, -1 when it does not accept
+        tokens = None
+        if self.tokens is not None:
+            tokens = array('i', [-1]) * (n + 1)
+            for state, token in self.tokens.items():
+                tokens[ids[state]] = token
+            
+        self.compiled = CompiledDFA(list(self.symbols), table, ids[self.initial_state], accepting, tokens)
+        
+        return self.compiled
+    
+    
+    def e_closure_state(self, s, adjacency, cache=None):
+        if cache is not None:
+            try:
+                return cache.states[s]
+            except KeyError:
+                cache.states[s] = closure = DFA.e_closure_state(self, s, adjacency)
+                return closure
+        
         closure = [s]
+        seen = {s}
         
         stack = Stack()
         stack.push(s)
@@ -484,46 +1068,76 @@ class DFA(FA):
         while not stack.is_empty():
             state = stack.pop()
             
-            for key in transition_function.keys():
-                if key[0] == state and key[1] == 'ε':
-                    for x in transition_function[key]:
-                        if x not in closure:
-                            closure.append(x)
-                            stack.push(x)
+            # only the ε successors of the popped state are visited
+            for x in adjacency[state].get('ε', []):
+                if x not in seen:
+                    seen.add(x)
+                    closure.append(x)
+                    stack.push(x)
             
             
         return closure
     
     
-    def e_closure_set(self, T, transition_function):
-        t_func = transition_function
+    def e_closure_set(self, T, adjacency, cache=None):
+        if cache is not None:
+            return DFA.cached_closure_set(self, T, adjacency, cache)
+        
         stack = Stack()
         
         for t in T:
             stack.push(t)
             
         closure = T[:]
+        seen = set(T)
         
         while not stack.is_empty():
             top = stack.pop()
             
-            for key, value in t_func.items():
-                if key[0] == top and key[1] == 'ε':
-                    for x in value:
-                        if x not in closure:
-                            closure.append(x)
-                            stack.push(x)
+            for x in adjacency[top].get('ε', []):
+                if x not in seen:
+                    seen.add(x)
+                    closure.append(x)
+                    stack.push(x)
                     
         return closure            
     
     
-    def move(self, sset, symbol, transition_function):
+    def cached_closure_set(self, T, adjacency, cache):
+        key = frozenset(T)
+        closure = cache.get(key)
+        
+        if closure is None:
+            closure = []
+            seen = set()
+            
+            # the closure of a set is the union of its states closures
+            for t in T:
+                for x in DFA.e_closure_state(self, t, adjacency, cache):
+                    if x not in seen:
+                        seen.add(x)
+                        closure.append(x)
+            
+            cache.put(key, closure)
+            
+        return closure
+    
+    
+    def move(self, sset, symbol, adjacency, labels=None):
         move_set = []
+        seen = set()
         
-        for key in transition_function.keys():
-            if key[0] in sset and key[1] == symbol: 
-                for x in transition_function[key]:
-                    move_set.append(x)
+        # a character follows the edges of every label that contains it
+        labels = labels if labels is not None else (symbol,)
+        
+        for state in sset:
+            edges = adjacency[state]
+            
+            for label in labels:
+                for x in edges.get(label, []):
+                    if x not in seen:
+                        seen.add(x)
+                        move_set.append(x)
             
         return move_set
     
@@ -531,23 +1145,433 @@ class DFA(FA):
     def simulate(self, string):
         start = timer()
         
-        s = self.initial_state
+        compiled = self.compiled or self.compile()
+        
+        table = compiled.table
+        columns = compiled.columns
+        byte_map = columns.byte_map
+        k = len(columns)
+        
+        s = compiled.initial_state
         terminal = False
+        taken = 0
         
-        for char in string:
-            if char not in self.symbols:
+        for taken, char in enumerate(string, 1):
+            # one lookup per character: byte map for latin-1, range search above it
+            code = ord(char)
+            column = byte_map[code] if code < 256 else columns.search(code)
+            
+            if column == k:
                 print(Colors.FAIL + "[ERROR] " + Colors.ENDC + " Símbolo " + char + " no reconocido por el autómata")
                 terminal = None
                 break
-                exit()
             
-            try:
-                s = self.transition_function[(s, char)]
-            except:
+            s = table[s * k + column]
+            
+            if s == compiled.dead_state:
                 break
         
-        terminal = True if s in self.terminal_states else terminal
+        terminal = True if compiled.accepting[s] and terminal is not None else terminal
         
         end = timer()
         
-        return ((end - start) * 1000, terminal if terminal is None else "YES ^_^" if terminal else "NO... O_o")
\ No newline at end of file
+        if self.sink is not None:
+            self.tally('simulate', transitions_taken=taken if terminal is not None else taken - 1)
+            self.emit('simulate', 'DFA', start, length=len(string), accepted=terminal)
+        
+        return ((end - start) * 1000, terminal if terminal is None else "YES ^_^" if terminal else "NO... O_o")
+    
+    
+    def simulate_many(self, strings, max_cells=1 << 22):
+        # needs numpy, an optional dependency used only for batch matching
+        compiled = self.compiled or self.compile()
+        
+        return compiled.accepts_many(strings, max_cells=max_cells)
+
+
+
+
+class CompiledDFA(object):
+    """
+    CLASS COMPILED DFA
+    
+    Forma compilada de un DFA. Los estados se numeran 0..n-1 y los símbolos se
+    mapean a columnas, las transiciones viven en una tabla contigua de enteros
+    (array('i')) con una fila reservada para el estado muerto (n).
+    
+    Params:
+        -> symbols (list): símbolos del alfabeto, en orden de columna
+        -> table (array): tabla de transiciones de (n + 1) * k enteros
+        -> initial_state (int): estado inicial
+        -> accepting (bytearray): 1 para cada estado de aceptación
+        -> tokens (array): token de cada estado (-1 si no acepta), o None
+    """
+    def __init__(self, symbols, table, initial_state, accepting, tokens=None):
+        self.symbols = symbols
+        self.tokens = tokens
+        self.columns = Alphabet(symbols)
+        self.table = table
+        self.initial_state = initial_state
+        self.accepting = accepting
+        
+        self.n_states = len(accepting) - 1
+        self.dead_state = self.n_states
+        
+        
+    def freeze(self):
+        # read only buffers, shared safely between threads and callers
+        self.table = memoryview(self.table).toreadonly()
+        self.accepting = bytes(self.accepting)
+        
+        if self.tokens is not None:
+            self.tokens = memoryview(self.tokens).toreadonly()
+            
+        return self
+    
+    
+    def nbytes(self):
+        return memoryview(self.table).nbytes + len(self.accepting) + (memoryview(self.tokens).nbytes if self.tokens is not None else 0)
+        
+        
+    def step(self, state, symbol):
+        return self.table[state * len(self.symbols) + self.columns[symbol]]
+    
+    
+    def accepts(self, string):
+        table = self.table
+        columns = self.columns
+        byte_map = columns.byte_map
+        k = len(columns)
+        
+        s = self.initial_state
+        
+        for char in string:
+            code = ord(char)
+            column = byte_map[code] if code < 256 else columns.search(code)
+            
+            if column == k:
+                return False
+            
+            s = table[s * k + column]
+            
+            if s == self.dead_state:
+                return False
+            
+        return bool(self.accepting[s])
+    
+    
+    def run(self, string, state, start=0):
+        # final state reached from `state` reading string[start:], the dead state on any miss
+        table = self.table
+        columns = self.columns
+        byte_map = columns.byte_map
+        k = len(columns)
+        
+        for i in range(start, len(string)):
+            code = ord(string[i])
+            column = byte_map[code] if code < 256 else columns.search(code)
+            
+            if column == k:
+                return self.dead_state
+            
+            state = table[state * k + column]
+            
+            if state == self.dead_state:
+                break
+        
+        return state
+    
+    
+    def batch_table(self):
+        import numpy as np
+        
+        n = self.n_states
+        k = len(self.symbols)
+        
+        # two extra columns: unknown symbols go to the dead state, padding keeps the state
+        table = np.empty((n + 1, k + 2), dtype=np.int32)
+        table[:, :k] = np.frombuffer(self.table, dtype=np.int32).reshape(n + 1, k)
+        table[:, k] = self.dead_state
+        table[:, k + 1] = np.arange(n + 1, dtype=np.int32)
+        
+        return table
+    
+    
+    def encode_batch(self, strings):
+        import numpy as np
+        
+        k = len(self.symbols)
+        lengths = np.fromiter((len(x) for x in strings), dtype=np.int64, count=len(strings))
+        width = int(lengths.max()) if len(strings) else 0
+        
+        # code points of the whole batch, mapped to columns with a search over the class ranges
+        codes = np.frombuffer(''.join(strings).encode('utf-32-le'), dtype=np.uint32)
+        
+        starts = np.array(self.columns.starts, dtype=np.int64)
+        ends = np.array(self.columns.ends + [-1], dtype=np.int64)
+        ids = np.array(self.columns.ids + [k], dtype=np.int32)
+        
+        # codes below the first range point to the sentinel entry at the end
+        index = np.searchsorted(starts, codes, side='right') - 1
+        index[index < 0] = len(starts)
+        columns = np.where(codes <= ends[index], ids[index], k).astype(np.int32)
+        
+        # padded symbol-index matrix, one row per string
+        matrix = np.full((len(strings), width), k + 1, dtype=np.int32)
+        matrix[np.arange(width) < lengths[:, None]] = columns
+        
+        return matrix, lengths
+    
+    
+    def batches(self, lengths, max_cells):
+        # lengths are sorted, so a chunk's width is its last length: grow it while rows * width fits
+        a = 0
+        
+        while a < len(lengths):
+            lo, hi = a + 1, len(lengths)
+            
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                
+                if (mid - a) * int(lengths[mid - 1]) <= max_cells:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            
+            yield a, lo
+            
+            a = lo
+    
+    
+    def accepts_many(self, strings, max_cells=1 << 22):
+        """
+        Reconoce un lote de cadenas con numpy (dependencia opcional, solo se importa
+        aquí). Las cadenas se ordenan por longitud y se agrupan en bloques de a lo más
+        `max_cells` símbolos con relleno, así una cadena larga no infla el bloque de las
+        cortas; las filas que terminan o mueren salen del bloque en cada paso.
+        
+        Params:
+            -> strings (iterable): cadenas a reconocer
+            -> max_cells (int): filas * ancho máximo de cada bloque
+        """
+        import numpy as np
+        
+        strings = list(strings)
+        table = self.batch_table()
+        accepting = np.frombuffer(bytes(self.accepting), dtype=np.uint8).astype(bool)
+        result = np.empty(len(strings), dtype=bool)
+        
+        lengths = np.fromiter((len(x) for x in strings), dtype=np.int64, count=len(strings))
+        order = np.argsort(lengths, kind='stable')
+            
+        for a, b in self.batches(lengths[order], max_cells):
+            chunk = order[a:b]
+            matrix, chunk_lengths = self.encode_batch([strings[i] for i in chunk])
+            
+            final = np.full(len(chunk), self.initial_state, dtype=np.int32)
+            rows = np.flatnonzero(chunk_lengths > 0)
+            states = final[rows]
+            
+            # live rows advance together, one gather per column
+            for j in range(matrix.shape[1]):
+                if len(rows) < 32:
+                    # a few long rows left: a gather per column costs more than the plain loop
+                    for row, state in zip(rows.tolist(), states.tolist()):
+                        final[row] = self.run(strings[chunk[row]], state, j)
+                
+                    break
+                
+                states = table[states, matrix[rows, j]]
+                done = (states == self.dead_state) | (chunk_lengths[rows] <= j + 1)
+                
+                if done.any():
+                    final[rows[done]] = states[done]
+                    rows = rows[~done]
+                    states = states[~done]
+            
+            result[chunk] = accepting[final]
+            
+        return result
+
+
+
+
+class CompiledNFA(object):
+    """
+    CLASS COMPILED NFA
+    
+    Forma compilada de un NFA de Thompson, con la misma interfaz que CompiledDFA:
+    accepts() devuelve False ante un símbolo desconocido y accepts_many() reconoce
+    un lote. La simulación usa el motor bitset, cuyas tablas se llenan bajo demanda
+    con valores deterministas, así que se puede compartir entre hilos.
+    
+    Params:
+        -> nfa (NFA): autómata construido con thompson()
+    """
+    def __init__(self, nfa):
+        self.engine = BitParallelNFA(nfa)
+        self.columns = self.engine.symbol_ids
+        self.n_states = self.engine.n_states
+    
+    
+    def freeze(self):
+        return self
+    
+    
+    def nbytes(self):
+        return self.engine.nbytes()
+    
+    
+    def accepts(self, string):
+        engine = self.engine
+        columns = self.columns
+        byte_map = columns.byte_map
+        k = len(columns)
+        
+        active = engine.initial
+        
+        for char in string:
+            code = ord(char)
+            column = byte_map[code] if code < 256 else columns.search(code)
+            
+            if column == k:
+                return False
+            
+            active = engine.step(active, column)
+            
+            if not active:
+                return False
+        
+        return bool(active & engine.accepting)
+    
+    
+    def accepts_many(self, strings):
+        # same result type as CompiledDFA.accepts_many, numpy is only imported here
+        import numpy as np
+        
+        strings = list(strings)
+        
+        return np.fromiter((self.accepts(string) for string in strings), dtype=bool, count=len(strings))
+
+
+
+
+class StreamMatcher(object):
+    """
+    CLASS STREAM MATCHER
+    
+    Simula un DFA (con su tabla compilada) o un NFA (con el motor bitset) sobre una
+    entrada que llega por partes. El estado actual se conserva entre llamadas a feed(),
+    y finish() indica si la entrada completa es aceptada. Acepta str, o bytes, 
+    memoryview y mmap, que se recorren sin copiarse (cada byte es el caracter latin-1
+    del mismo valor).
+    
+    Params:
+        -> automata (DFA | CompiledDFA | NFA | CompiledNFA): autómata a simular
+    """
+    def __init__(self, automata):
+        if isinstance(automata, DFA):
+            automata = automata.compiled or automata.compile()
+        
+        if isinstance(automata, CompiledDFA):
+            self.table = automata.table
+            self.k = len(automata.symbols)
+            self.engine = None
+            self.initial = automata.initial_state
+            self.dead = automata.dead_state
+            self.columns = automata.columns
+            self.accepting = lambda state: bool(automata.accepting[state])
+        else:
+            self.table = None
+            self.engine = automata.engine if isinstance(automata, CompiledNFA) else automata.engine('bitset')
+            self.initial = self.engine.initial
+            self.dead = 0
+            self.columns = self.engine.symbol_ids
+            self.accepting = lambda state: bool(state & self.engine.accepting)
+        
+        # columns for raw bytes
+        self.byte_columns = [self.columns.get(chr(b)) for b in range(256)]
+        
+        self.reset()
+        
+        
+    def reset(self):
+        self.state = self.initial
+        self.position = 0
+        
+        
+    def feed(self, chunk):
+        if isinstance(chunk, str):
+            self.advance(chunk, self.columns.get)
+        else:
+            with memoryview(chunk) as view:
+                with view.cast('B') as data:
+                    self.advance(data, self.byte_columns.__getitem__)
+                
+        self.position += len(chunk)
+        
+        return self.state
+    
+    
+    def advance(self, data, column_of):
+        state = self.state
+        dead = self.dead
+        
+        if state == dead:
+            return
+        
+        if self.table is not None:
+            table = self.table
+            k = self.k
+            
+            for x in data:
+                column = column_of(x)
+                
+                if column is None:
+                    state = dead
+                    break
+                
+                state = table[state * k + column]
+                
+                if state == dead:
+                    break
+        else:
+            step = self.engine.step
+            
+            for x in data:
+                column = column_of(x)
+                
+                if column is None:
+                    state = dead
+                    break
+                
+                state = step(state, column)
+                
+                if state == dead:
+                    break
+                
+        self.state = state
+        
+        
+    def feed_file(self, path, chunk_size=None):
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return self.state
+            
+            # the file is mapped, pages are read by the OS as the matcher advances
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if chunk_size is None:
+                    return self.feed(data)
+                
+                with memoryview(data) as view:
+                    for offset in range(0, len(view), chunk_size):
+                        self.feed(view[offset:offset + chunk_size])
+                        
+        return self.state
+    
+    
+    def finish(self):
+        accepted = self.accepting(self.state)
+        self.reset()
+        
+        return accepted
@@ -0,0 +1,322 @@
+import os
+import sys
+import json
+import random
+import string
+import argparse
+import platform
+import subprocess
+import tracemalloc
+from datetime import datetime
+from timeit import default_timer as timer
+
+from automatas import NFA, DFA
+from structures import SyntaxTree, OPERATORS, END
+
+
+ALPHABET = string.ascii_lowercase + string.ascii_uppercase + string.digits
+
+
+def family_length(n, k=2):
+    # a star over the alphabet followed by n concatenated symbols
+    alphabet = ALPHABET[:k]
+    
+    return '(' + '|'.join(alphabet) + ')*' + ''.join(alphabet[i % k] for i in range(n))
+
+
+def family_nesting(n, k=2):
+    # n nested stars, each one adds an alternative
+    alphabet = ALPHABET[:k]
+    regex = alphabet[0]
+    
+    for i in range(n):
+        regex = '(' + regex + '|' + alphabet[(i + 1) % k] + ')*'
+    
+    return regex
+
+
+def family_alphabet(n, k=None):
+    alphabet = ALPHABET[:n]
+    
+    return '(' + '|'.join(alphabet) + ')*' + alphabet[0]
+
+
+def family_plus(n, k=2):
+    # n nested '+', the direct method used to copy the whole subtree at each level
+    alphabet = ALPHABET[:k]
+    regex = alphabet[0]
+    
+    for i in range(n):
+        regex = '(' + regex + alphabet[(i + 1) % k] + ')+'
+    
+    return regex
+
+
+def family_exponential(n, k=2):
+    # (a|b)*a(a|b){n}: the DFA needs 2^(n + 1) states
+    return '(a|b)*a' + '(a|b)' * n
+
+
+# modules whose cold import is measured, and the ones they must not pull in
+IMPORTS = ('structures', 'automatas')
+HEAVY_MODULES = ('numpy', 'graphviz', 'shortuuid', 'uuid', 'tempfile', 'graphs')
+
+# positions of the annotated trees whose memory per node is tracked
+NODE_SIZES = [1000, 10000, 40000]
+
+
+FAMILIES = {
+    'length': (family_length, [4, 16, 64, 256]),
+    'nesting': (family_nesting, [1, 2, 4, 8, 16]),
+    'alphabet': (family_alphabet, [2, 4, 8, 16, 32, 62]),
+    'plus': (family_plus, [1, 4, 16, 64, 256]),
+    'exponential': (family_exponential, [1, 2, 4, 6, 8, 10]),
+}
+
+
+def measure(function, repeat):
+    """
+    Ejecuta una fase: el tiempo es el mejor de `repeat` corridas sin trazar memoria,
+    y la memoria pico se mide en una corrida aparte con tracemalloc.
+    """
+    best = None
+    result = None
+    
+    for _ in range(repeat):
+        start = timer()
+        result = function()
+        elapsed = timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    
+    return result, best, peak
+
+
+def annotated_tree(regex):
+    # the tree as the direct method uses it: annotated, with the root's firstpos built
+    tree = SyntaxTree(OPERATORS, regex, direct=True, end=END)
+    tree.annotate()
+    tree.root.firstmask
+    
+    return tree
+
+
+def node_memory(regex):
+    # memory retained by the annotated tree, measured apart from the construction peak
+    tracemalloc.start()
+    tree = annotated_tree(regex)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    
+    nodes = len(tree.nodes)
+    
+    return {'nodes': nodes, 'bytes_per_node': retained / nodes if nodes else 0}
+
+
+def import_time(module, repeat):
+    """
+    Importa `module` en un intérprete nuevo: el tiempo es el mejor de `repeat` corridas,
+    y se listan los módulos pesados que el import dejó cargados.
+    """
+    code = (
+        'import sys, json; from timeit import default_timer as timer; start = timer(); '
+        'import %s; print(json.dumps([timer() - start, list(sys.modules)]))' % module
+    )
+    best = None
+    
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        elapsed, modules = json.loads(output)
+        best = elapsed if best is None else min(best, elapsed)
+    
+    heavy = sorted(m for m in modules if m.split('.')[0] in HEAVY_MODULES)
+    
+    return {'family': 'import', 'n': 0, 'regex_length': 0, 'phase': 'import_' + module, 'wall_time': best, 'peak_memory': 0, 'heavy_modules': heavy}
+
+
+def count(automata):
+    states, transitions = automata.size()
+    
+    return {'states': states, 'transitions': transitions}
+
+
+def run_nodes(n, args):
+    # tree only, sizes too large for the full pipeline still show how memory per node grows
+    regex = family_length(n, args.alphabet)
+    _, wall, peak = measure(lambda: annotated_tree(regex), args.repeat)
+    
+    entry = {'family': 'nodes', 'n': n, 'regex_length': len(regex), 'phase': 'annotate', 'wall_time': wall, 'peak_memory': peak}
+    entry.update(node_memory(regex))
+    
+    return [entry]
+
+
+def run_workload(family, n, args):
+    builder, _ = FAMILIES[family]
+    regex = builder(n, args.alphabet)
+    symbols = sorted(set(c for c in regex if c not in OPERATORS and c not in '()'))
+    records = []
+    
+    def record(phase, wall, peak, **details):
+        entry = {'family': family, 'n': n, 'regex_length': len(regex), 'phase': phase, 'wall_time': wall, 'peak_memory': peak}
+        entry.update(details)
+        records.append(entry)
+    
+    tree, wall, peak = measure(lambda: SyntaxTree(OPERATORS, regex), args.repeat)
+    record('tree', wall, peak, height=tree.height(), **node_memory(regex))
+    
+    def thompson():
+        t = SyntaxTree(OPERATORS, regex)
+        nfa = NFA(t.symbols, t)
+        nfa.thompson()
+        
+        return nfa
+    
+    nfa, wall, peak = measure(thompson, args.repeat)
+    record('thompson', wall, peak, **count(nfa))
+    
+    def subset():
+        dfa = DFA(nfa)
+        dfa.subset()
+        
+        return dfa
+    
+    dfa, wall, peak = measure(subset, args.repeat)
+    record('subset', wall, peak, **count(dfa))
+    
+    minimal, wall, peak = measure(dfa.minimize, args.repeat)
+    record('minimize', wall, peak, **count(minimal))
+    
+    def direct():
+        t = SyntaxTree(OPERATORS, regex, direct=True, end=END)
+        nodes = t.traverse_postorder(t.root, full=True)
+        d = DFA(syntax_tree=t, direct=True, nodes=nodes, markers={END: 0})
+        d.direct()
+        
+        return d
+    
+    direct_dfa, wall, peak = measure(direct, args.repeat)
+    record('direct', wall, peak, **count(direct_dfa))
+    
+    # simulation over random inputs of growing length
+    rng = random.Random(args.seed)
+    length = 10
+    
+    while length <= args.max_input:
+        text = ''.join(rng.choice(symbols) for _ in range(length))
+        
+        _, wall, peak = measure(lambda: minimal.simulate(text), args.repeat)
+        record('simulate_dfa', wall, peak, input_length=length, **count(minimal))
+        
+        for engine in args.engines:
+            if engine == 'set' and length > args.max_set_input:
+                continue
+            
+            _, wall, peak = measure(lambda: nfa.simulate(text, engine=engine), args.repeat)
+            record('simulate_nfa_' + engine, wall, peak, input_length=length, **count(nfa))
+        
+        length *= 10
+    
+    return records
+
+
+def compare(baseline, report, threshold=1.2):
+    """
+    Compara dos reportes y devuelve las fases cuyo tiempo creció más que `threshold` veces.
+    """
+    key = lambda r: (r['family'], r['n'], r['phase'], r.get('input_length'))
+    before = {key(r): r for r in baseline['results']}
+    regressions = []
+    
+    for r in report['results']:
+        old = before.get(key(r))
+        
+        if old and old['wall_time'] > 0 and r['wall_time'] / old['wall_time'] > threshold:
+            regressions.append({'key': key(r), 'before': old['wall_time'], 'after': r['wall_time']})
+    
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de construcción y simulación de autómatas")
+    parser.add_argument('--families', default=','.join(FAMILIES), help="familias de expresiones, separadas por comas")
+    parser.add_argument('--sizes', default=None, help="parámetros n de cada familia, separados por comas")
+    parser.add_argument('--alphabet', type=int, default=2, help="tamaño del alfabeto para length y nesting")
+    parser.add_argument('--engines', default='bitset,lazy', help="motores de simulación del NFA (set, bitset, lazy)")
+    parser.add_argument('--max-input', type=int, default=10 ** 5, help="longitud máxima de la entrada (hasta 10^7)")
+    parser.add_argument('--max-set-input', type=int, default=10 ** 4, help="longitud máxima para el motor set")
+    parser.add_argument('--repeat', type=int, default=3, help="corridas por fase, se reporta la mejor")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='-', help="archivo JSON de salida ('-' para stdout)")
+    parser.add_argument('--compare', default=None, help="reporte JSON previo para detectar regresiones")
+    parser.add_argument('--threshold', type=float, default=1.2, help="razón de tiempo que cuenta como regresión")
+    parser.add_argument('--imports', default=','.join(IMPORTS), help="módulos cuyo import en frío se mide ('' para omitir)")
+    parser.add_argument('--import-budget', type=float, default=None, help="tiempo máximo de import en frío (ms)")
+    parser.add_argument('--node-sizes', default=','.join(str(n) for n in NODE_SIZES), help="posiciones de los árboles anotados cuya memoria por nodo se mide ('' para omitir)")
+    args = parser.parse_args(argv)
+    
+    args.engines = [engine for engine in args.engines.split(',') if engine]
+    
+    results = [import_time(module, args.repeat) for module in args.imports.split(',') if module]
+    
+    for n in [int(x) for x in args.node_sizes.split(',') if x]:
+        results += run_nodes(n, args)
+    
+    for family in [family for family in args.families.split(',') if family]:
+        sizes = [int(x) for x in args.sizes.split(',')] if args.sizes else FAMILIES[family][1]
+        
+        for n in sizes:
+            results += run_workload(family, n, args)
+    
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': sys.version,
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    
+    # cold start guard: the engine must stay within budget and load only the standard library
+    failed = False
+    for r in results:
+        if r['family'] != 'import':
+            continue
+        
+        if r['heavy_modules']:
+            print("[IMPORT] %s loads %s" % (r['phase'], ', '.join(r['heavy_modules'])), file=sys.stderr)
+            failed = True
+        
+        if args.import_budget is not None and r['wall_time'] * 1000 > args.import_budget:
+            print("[IMPORT] %s: %.3f (ms) over the %.3f (ms) budget" % (r['phase'], r['wall_time'] * 1000, args.import_budget), file=sys.stderr)
+            failed = True
+    
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        
+        for regression in regressions:
+            print("[REGRESSION] %s: %.6f -> %.6f (s)" % (regression['key'], regression['before'], regression['after']), file=sys.stderr)
+        
+        failed = failed or bool(regressions)
+    
+    if failed:
+        sys.exit(1)
+    
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import threading
+from collections import OrderedDict
+
+from automatas import NFA, DFA, CompiledNFA
+from structures import SyntaxTree, OPERATORS, END
+
+
+METHODS = ('direct', 'subset', 'thompson')
+
+
+def build(regex, method='direct', operators=OPERATORS, minimize=True):
+    """
+    Construye la forma compilada de una expresión regular, sin usar la caché.
+    
+    Params:
+        -> regex (string): expresión regular
+        -> method (string): 'direct', 'subset' o 'thompson'
+        -> operators (dict): operadores reconocidos y su precedencia
+        -> minimize (bool): minimizar el DFA (direct y subset)
+    """
+    if method == 'direct':
+        tree = SyntaxTree(operators, regex, direct=True, end=END)
+        nodes = tree.traverse_postorder(tree.root, full=True)
+        
+        dfa = DFA(syntax_tree=tree, direct=True, nodes=nodes, markers={END: 0})
+        dfa.direct(minimize=minimize)
+        
+        return dfa.compile().freeze()
+    
+    tree = SyntaxTree(operators, regex)
+    nfa = NFA(tree.symbols, tree)
+    nfa.thompson()
+    
+    if method == 'thompson':
+        return CompiledNFA(nfa)
+    
+    if method == 'subset':
+        dfa = DFA(nfa)
+        dfa.subset(minimize=minimize)
+        
+        return dfa.compile().freeze()
+    
+    raise ValueError("Unknown construction method: " + method)
+
+
+
+
+class RegexCache(object):
+    """
+    CLASS REGEX CACHE
+    
+    Caché LRU en memoria de expresiones compiladas, segura entre hilos. Se limita
+    por cantidad de entradas y por bytes estimados, y opcionalmente consulta una
+    caché en disco (storage.AutomataCache) antes de construir.
+    
+    Params:
+        -> maxsize (int): cantidad máxima de expresiones guardadas
+        -> max_memory (int): bytes máximos estimados de todas las entradas
+        -> disk (AutomataCache): caché en disco para los DFA, o None
+    """
+    def __init__(self, maxsize=256, max_memory=64 << 20, disk=None):
+        self.maxsize = maxsize
+        self.max_memory = max_memory
+        self.disk = disk
+        
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.memory = 0
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    
+    def compile(self, regex, method='direct', operators=OPERATORS, minimize=True):
+        if method not in METHODS:
+            raise ValueError("Unknown construction method: " + method)
+        
+        key = (regex, method, tuple(sorted(operators.items())), minimize)
+        
+        with self.lock:
+            try:
+                automata, size = self.entries[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                
+                return automata
+        
+        # built outside the lock, other patterns can be served meanwhile
+        if self.disk is not None and method != 'thompson':
+            automata = self.disk.load_or_build(regex, operators, method + ('' if minimize else '-raw'), lambda: build(regex, method, operators, minimize))
+        else:
+            automata = build(regex, method, operators, minimize)
+        
+        size = automata.nbytes()
+        
+        with self.lock:
+            if key in self.entries:
+                return self.entries[key][0]
+            
+            self.entries[key] = (automata, size)
+            self.memory += size
+            
+            while len(self.entries) > 1 and (len(self.entries) > self.maxsize or self.memory > self.max_memory):
+                old, (_, old_size) = self.entries.popitem(last=False)
+                self.memory -= old_size
+                self.evictions += 1
+        
+        return automata
+    
+    
+    def warm_up(self, patterns, method='direct', operators=OPERATORS, minimize=True):
+        for regex in patterns:
+            self.compile(regex, method, operators, minimize)
+        
+        return self.info()
+    
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.memory = 0
+            self.hits = self.misses = self.evictions = 0
+    
+    
+    def info(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'memory': self.memory,
+                'max_memory': self.max_memory,
+            }
+
+
+
+
+# process wide cache used by compile()
+cache = RegexCache()
+
+
+def compile(regex, method='direct', operators=OPERATORS, minimize=True):
+    """
+    Devuelve la expresión regular compilada (CompiledDFA para 'direct' y 'subset',
+    CompiledNFA para 'thompson'), reutilizando la caché del proceso.
+    """
+    return cache.compile(regex, method, operators, minimize)
+
+
+def warm_up(patterns, method='direct', operators=OPERATORS, minimize=True):
+    """
+    Compila por adelantado una lista de expresiones regulares.
+    """
+    return cache.warm_up(patterns, method, operators, minimize)
@@ -0,0 +1,179 @@
+import os
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+# states drawn before the rest of the automaton is folded into a single node
+MAX_STATES = 200
+
+# formats written as plain DOT text, anything else goes through the Graphviz binary
+TEXT_FORMATS = ('gv', 'dot')
+
+# shared background renderer, created on the first background export
+renderer = None
+
+
+def quote(text):
+    return '"' + str(text).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def edges(automata):
+    # (source, target) -> labels, parallel transitions are drawn as a single edge
+    grouped = {}
+    
+    for (state, symbol), value in automata.transition_function.items():
+        for target in ((value,) if isinstance(value, int) else value):
+            grouped.setdefault((state, target), []).append(symbol)
+    
+    return grouped
+
+
+def nearest(automata, grouped, limit):
+    # breadth first from the initial state, a capped drawing keeps the part closest to the start
+    successors = {}
+    for source, target in grouped:
+        successors.setdefault(source, []).append(target)
+    
+    kept = {automata.initial_state: None}
+    queue = deque([automata.initial_state])
+    
+    while queue and len(kept) < limit:
+        for target in successors.get(queue.popleft(), ()):
+            if target not in kept and len(kept) < limit:
+                kept[target] = None
+                queue.append(target)
+    
+    # unreachable states fill whatever room is left
+    for state in automata.states:
+        if len(kept) >= limit:
+            break
+        
+        kept.setdefault(state, None)
+    
+    return kept
+
+
+def to_dot(automata, max_states=MAX_STATES, collapse=True):
+    """
+    Genera el texto DOT de un autómata, sin depender de Graphviz. Las transiciones
+    paralelas se unen en una sola arista. Si el autómata tiene más de `max_states`
+    estados solo se dibujan los más cercanos al estado inicial, y el resto se agrupa
+    en un solo nodo (o se omite), así el costo de dibujar queda acotado.
+    
+    Params:
+        -> automata (FA): autómata a dibujar
+        -> max_states (int): estados dibujados como máximo (None = todos)
+        -> collapse (bool): agrupar los estados omitidos en un solo nodo
+    """
+    name = automata.state_name
+    grouped = edges(automata)
+    terminal = set(automata.terminal_states)
+    
+    if max_states is not None and len(automata.states) > max_states:
+        kept = nearest(automata, grouped, max_states)
+    else:
+        kept = dict.fromkeys(automata.states)
+    
+    hidden = len(automata.states) - len(kept)
+    
+    lines = ['digraph {', '\trankdir=LR', '\tnode [shape=circle]']
+    
+    for state in kept:
+        shape = ' [shape=doublecircle]' if state in terminal else ''
+        lines.append('\t' + quote(name(state)) + shape)
+    
+    lines.append('\t"" [shape=none]')
+    lines.append('\t"" -> ' + quote(name(automata.initial_state)))
+    
+    # edges into the omitted part, one per source state
+    folded = {}
+    
+    for (source, target), labels in grouped.items():
+        if source not in kept:
+            continue
+        
+        if target not in kept:
+            if collapse:
+                folded.setdefault(source, []).extend(labels)
+            
+            continue
+        
+        lines.append('\t%s -> %s [label=%s]' % (quote(name(source)), quote(name(target)), quote(','.join(labels))))
+    
+    if hidden and collapse:
+        lines.append('\t"..." [shape=box, style=dashed, label=%s]' % quote('+%d estados' % hidden))
+        
+        for source, labels in folded.items():
+            lines.append('\t%s -> "..." [label=%s, style=dashed]' % (quote(name(source)), quote(','.join(dict.fromkeys(labels)))))
+    
+    lines.append('}')
+    
+    return '\n'.join(lines) + '\n'
+
+
+def render(text, path, format=None, engine='dot'):
+    """
+    Escribe un texto DOT en `path`. Con formato 'gv' o 'dot' se guarda el texto tal
+    cual; con cualquier otro (svg, png, pdf...) se llama al binario de Graphviz, que
+    escribe el archivo directamente sin abrir ningún visor.
+    
+    Params:
+        -> text (string): grafo en formato DOT
+        -> path (string): ruta del archivo
+        -> format (string): formato de salida (None = extensión de la ruta)
+        -> engine (string): programa de Graphviz para el layout
+    """
+    format = format or os.path.splitext(path)[1][1:].lower() or 'gv'
+    
+    if format in TEXT_FORMATS:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        
+        return path
+    
+    try:
+        subprocess.run([engine, '-T' + format, '-o', path], input=text.encode('utf-8'), check=True, capture_output=True)
+    except FileNotFoundError:
+        raise RuntimeError("Graphviz ('%s') no está instalado, use el formato 'gv' para obtener solo el DOT" % engine)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError("Graphviz no pudo generar %s: %s" % (path, e.stderr.decode('utf-8', 'replace').strip()))
+    
+    return path
+
+
+def export(automata, path=None, format=None, background=False, executor=None, engine='dot', **options):
+    """
+    Exporta un autómata. Sin `path` devuelve el texto DOT; con `path` escribe el
+    archivo y devuelve la ruta. Con `background` el trabajo corre en otro hilo
+    (o en el executor dado) y se devuelve un Future, de modo que la simulación no
+    espera al dibujo.
+    
+    Params:
+        -> automata (FA): autómata a exportar
+        -> path (string): ruta del archivo (None = devolver el DOT)
+        -> format (string): formato de salida (None = extensión de la ruta)
+        -> background (bool): exportar en segundo plano
+        -> executor (Executor): executor para el segundo plano (None = un hilo compartido)
+        -> engine (string): programa de Graphviz para el layout
+        -> options: max_states y collapse de to_dot()
+    """
+    global renderer
+    
+    if path is None:
+        return to_dot(automata, **options)
+    
+    if not background and executor is None:
+        return render(to_dot(automata, **options), path, format, engine)
+    
+    if executor is None:
+        if renderer is None:
+            renderer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='graphs')
+        
+        executor = renderer
+    
+    if isinstance(executor, ProcessPoolExecutor):
+        # only the DOT text crosses the process boundary, the automaton is never pickled
+        return executor.submit(render, to_dot(automata, **options), path, format, engine)
+    
+    return executor.submit(lambda: render(to_dot(automata, **options), path, format, engine))
@@ -0,0 +1,122 @@
+from automatas import DFA
+from structures import SyntaxTree
+
+
+class Lexer(object):
+    """
+    CLASS LEXER
+    
+    Analizador léxico para una lista ordenada de tokens. Todas las expresiones se
+    unen en un solo árbol sintáctico, cada una terminada en su propio marcador de fin
+    (la generalización del '#' del método directo), y se construye un único DFA.
+    Cada estado de aceptación guarda el token con mayor prioridad (el primero de la
+    lista), y tokenize() recorre la entrada una sola vez con la regla del match más largo.
+    
+    Params:
+        -> operators (dict): operadores reconocidos y su precedencia
+        -> tokens (list): pares (nombre del token, expresión regular) en orden de prioridad
+        -> minimize (bool): minimizar el DFA combinado
+        -> sink (object): sink para las trazas de construcción
+    """
+    def __init__(self, operators, tokens, minimize=True, sink=None):
+        self.names = [name for name, regex in tokens]
+        
+        # one private use character per pattern, they never appear in the input
+        markers = {chr(0xE000 + i): i for i in range(len(tokens))}
+        regex = '|'.join('(' + pattern + ')' + marker for (name, pattern), marker in zip(tokens, markers))
+        
+        self.tree = SyntaxTree(operators, regex, direct=True, sink=sink)
+        nodes = self.tree.traverse_postorder(self.tree.root, full=True)
+        
+        self.dfa = DFA(syntax_tree=self.tree, direct=True, nodes=nodes, markers=markers)
+        self.dfa.direct(minimize=minimize)
+        
+        self.compiled = self.dfa.compile()
+    
+    
+    def tokenize(self, data, chunk_size=65536):
+        """
+        Recorre la entrada una sola vez y genera (token, inicio, fin). La entrada puede
+        ser un str, bytes, un archivo de texto o binario, o un iterable de partes; los
+        bytes se leen como latin-1 (cada byte es el caracter del mismo valor), igual
+        que en StreamMatcher.
+        
+        Params:
+            -> data (str | bytes | file | iterable): entrada a analizar
+            -> chunk_size (int): caracteres o bytes leídos por llamada a read()
+        """
+        if isinstance(data, (str, bytes, bytearray, memoryview)):
+            chunks = iter([data])
+        elif hasattr(data, 'read'):
+            # text and binary streams end with an empty read, '' or b''
+            chunks = iter(lambda: data.read(chunk_size) or None, None)
+        else:
+            chunks = iter(data)
+        
+        chunks = (chunk if isinstance(chunk, str) else bytes(chunk).decode('latin-1') for chunk in chunks)
+        
+        compiled = self.compiled
+        table = compiled.table
+        tokens = compiled.tokens
+        columns = compiled.columns
+        byte_map = columns.byte_map
+        k = len(columns)
+        dead = compiled.dead_state
+        
+        # buffer holds the input from the current token start, base is its offset
+        buffer = ''
+        base = 0
+        start = 0
+        eof = False
+        
+        while True:
+            state = compiled.initial_state
+            i = start
+            token = -1
+            end = start
+            
+            # maximal munch: keep going until the automaton dies, remember the last accept
+            while True:
+                if i == len(buffer):
+                    if eof:
+                        break
+                    
+                    chunk = next(chunks, None)
+                    
+                    if chunk is None:
+                        eof = True
+                        continue
+                    
+                    buffer = buffer[start:] + chunk
+                    base += start
+                    i -= start
+                    end -= start
+                    start = 0
+                    continue
+                
+                code = ord(buffer[i])
+                column = byte_map[code] if code < 256 else columns.search(code)
+                
+                if column == k:
+                    break
+                
+                state = table[state * k + column]
+                
+                if state == dead:
+                    break
+                
+                i += 1
+                
+                if tokens[state] >= 0:
+                    token = tokens[state]
+                    end = i
+            
+            if token < 0:
+                if eof and start == len(buffer):
+                    return
+                
+                raise ValueError("Ningún token reconoce la entrada en la posición %d" % (base + start))
+            
+            yield (self.names[token], base + start, base + end)
+            
+            start = end
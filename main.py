@@ -1,18 +1,21 @@
 from automatas import NFA, DFA
-from structures import SyntaxTree
-
-# operators and precedence
-OPERATORS = {
-    '|': 1,
-    '^': 2,
-    '*': 3,
-    '?': 3,
-    '+': 3
-}
+from structures import SyntaxTree, ColorPrinter, OPERATORS, END
 
 # epsilon char
 EPSILON = 'ε'
 
+# print every construction step
+VERBOSE = True
+
+# construction trace sink (None disables tracing)
+SINK = ColorPrinter() if VERBOSE else None
+
+# graph output format ('gv' only writes the DOT text, 'svg' or 'png' need Graphviz)
+GRAPH_FORMAT = 'gv'
+
+# graphs are rendered in the background, simulation never waits for them
+GRAPHS = []
+
 # string to evaluate
 STRING = 'aabbbbbaabaaaaaaaabb'
 
@@ -28,7 +31,7 @@ REGEX = '(a|b)*a(a|b)(a|b)'
 
 ## Syntax tree construction
 # generate tree from regex
-tree = SyntaxTree(OPERATORS, REGEX)
+tree = SyntaxTree(OPERATORS, REGEX, sink=SINK)
 
 
 ## Regex to NFA conversion (via Thompson)
@@ -37,7 +40,7 @@ nfa = NFA(tree.symbols, tree)
 nfa.thompson()
 
 # graph resulting NFA
-nfa.graph_automata()
+GRAPHS.append(nfa.graph_automata('nfa.' + GRAPH_FORMAT, background=True))
 
 time, result = nfa.simulate(STRING)
 
@@ -45,12 +48,12 @@ print("RESULTADO DE SIMULACION PARA NFA (Thompson)\n-> %s\n-> %.3f (ms)\n" % (re
 
 
 ## NFA to DFA conversion (via Subset)
-# instantiate DFA and call subset method 
+# instantiate DFA and call subset method (minimized)
 dfa = DFA(nfa)
-dfa.subset()
+dfa.subset(minimize=True)
 
 # graph resulting DFA
-dfa.graph_automata(mapping=dfa.state_mapping)
+GRAPHS.append(dfa.graph_automata('dfa.' + GRAPH_FORMAT, background=True))
 
 time, result = dfa.simulate(STRING)
 
@@ -59,21 +62,25 @@ print("RESULTADO DE SIMULACION PARA DFA (Subconjuntos)\n-> %s\n-> %.3f (ms)\n" %
 
 ## Regex to DFA using direct method
 # tree for direct build
-hash_tree = SyntaxTree(OPERATORS, REGEX + "#", direct=True)
+hash_tree = SyntaxTree(OPERATORS, REGEX, direct=True, sink=SINK, end=END)
 
 # get nodes for computing nullable, firstpos, lastpos and followpos
-print(hash_tree.traverse_postorder(hash_tree.root))
+VERBOSE and print(hash_tree.traverse_postorder(hash_tree.root))
 nodes = hash_tree.traverse_postorder(hash_tree.root, full=True)
 
 # instantiate dfa object
-direct_dfa = DFA(syntax_tree=hash_tree, direct=True, nodes=nodes)
+direct_dfa = DFA(syntax_tree=hash_tree, direct=True, nodes=nodes, markers={END: 0})
 
-# call direct method
-direct_dfa.direct()
+# call direct method (minimized)
+direct_dfa.direct(minimize=True)
 
 # graph resulting DFA
-direct_dfa.graph_automata(mapping=direct_dfa.state_mapping)
+GRAPHS.append(direct_dfa.graph_automata('direct_dfa.' + GRAPH_FORMAT, background=True))
 
 time, result = direct_dfa.simulate(STRING)
 
-print("RESULTADO DE SIMULACION PARA DFA (Directo)\n-> %s\n-> %.3f (ms)\n" % (result, time))
\ No newline at end of file
+print("RESULTADO DE SIMULACION PARA DFA (Directo)\n-> %s\n-> %.3f (ms)\n" % (result, time))
+
+# wait for the background renders before exiting
+for graph in GRAPHS:
+    print("GRAFO ESCRITO EN %s" % graph.result())
@@ -0,0 +1,154 @@
+import os
+from itertools import islice
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+
+# numpy is an optional dependency, only batch matching (this module and simulate_many) needs it
+import numpy as np
+
+from automatas import DFA, CompiledDFA
+
+
+# worker side: the automaton attached to the shared table, one per process
+worker = {}
+
+
+def attach(name, symbols, n_states, initial_state):
+    shm = SharedMemory(name=name)
+    k = len(symbols)
+    size = 4 * (n_states + 1) * k
+    
+    # views over the shared block, nothing is copied or unpickled
+    table = shm.buf[:size].cast('i')
+    accepting = shm.buf[size:size + n_states + 1]
+    
+    worker['shm'] = shm
+    worker['compiled'] = CompiledDFA(symbols, table, initial_state, accepting)
+
+
+def match_strings(strings):
+    return worker['compiled'].accepts_many(strings)
+
+
+def match_shard(path, start, end):
+    lines = []
+    
+    # a shard owns every line that starts inside [start, end)
+    with open(path, 'rb') as f:
+        if start > 0:
+            f.seek(start - 1)
+            f.readline()
+        
+        while f.tell() < end:
+            line = f.readline()
+            
+            if not line:
+                break
+            
+            lines.append(line.rstrip(b'\r\n').decode('utf-8'))
+    
+    return worker['compiled'].accepts_many(lines)
+
+
+def starmap_shard(args):
+    return match_shard(*args)
+
+
+def chunks(strings, size):
+    strings = iter(strings)
+    
+    while True:
+        chunk = list(islice(strings, size))
+        
+        if not chunk:
+            return
+        
+        yield chunk
+
+
+
+
+class ParallelMatcher(object):
+    """
+    CLASS PARALLEL MATCHER
+    
+    Reconoce lotes grandes de cadenas con un pool de procesos. La tabla de
+    transiciones del DFA se copia una sola vez a memoria compartida y cada proceso
+    se conecta a ella al iniciar, sin serializar el autómata. Los resultados
+    regresan en el orden de la entrada.
+    
+    Params:
+        -> automata (DFA | CompiledDFA): autómata a simular
+        -> processes (int): cantidad de procesos (None = núcleos disponibles)
+        -> chunk_size (int): cadenas enviadas a un proceso por tarea
+    """
+    def __init__(self, automata, processes=None, chunk_size=16384):
+        compiled = automata.compile() if isinstance(automata, DFA) else automata
+        
+        if not isinstance(compiled, CompiledDFA):
+            raise ValueError("Parallel matching needs a DFA or a CompiledDFA")
+        
+        self.chunk_size = chunk_size
+        self.processes = processes or os.cpu_count() or 1
+        
+        table = memoryview(compiled.table).cast('B')
+        accepting = bytes(compiled.accepting)
+        
+        # layout: (n + 1) * k transitions, then n + 1 accepting flags
+        self.shm = SharedMemory(create=True, size=max(len(table) + len(accepting), 1))
+        self.shm.buf[:len(table)] = table
+        self.shm.buf[len(table):len(table) + len(accepting)] = accepting
+        
+        self.pool = Pool(
+            self.processes,
+            initializer=attach,
+            initargs=(self.shm.name, list(compiled.symbols), compiled.n_states, compiled.initial_state)
+        )
+    
+    
+    def imap(self, strings):
+        # results are streamed in input order while later chunks are still running
+        for result in self.pool.imap(match_strings, chunks(strings, self.chunk_size)):
+            yield from result.tolist()
+    
+    
+    def accepts_many(self, strings):
+        results = list(self.pool.imap(match_strings, chunks(strings, self.chunk_size)))
+        
+        return np.concatenate(results) if results else np.empty(0, dtype=bool)
+    
+    
+    def shards(self, path, count=None):
+        size = os.path.getsize(path)
+        count = count or 4 * self.processes
+        step = max(size // count, 1)
+        
+        return [(path, start, min(start + step, size)) for start in range(0, size, step)]
+    
+    
+    def imap_file(self, path, count=None):
+        # one result per line of the file, in order
+        for result in self.pool.imap(starmap_shard, self.shards(path, count)):
+            yield from result.tolist()
+    
+    
+    def match_file(self, path, count=None):
+        results = self.pool.starmap(match_shard, self.shards(path, count))
+        
+        return np.concatenate(results) if results else np.empty(0, dtype=bool)
+    
+    
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        
+        self.shm.close()
+        self.shm.unlink()
+    
+    
+    def __enter__(self):
+        return self
+    
+    
+    def __exit__(self, *args):
+        self.close()
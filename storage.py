@@ -0,0 +1,307 @@
+import os
+import sys
+import mmap
+import json
+import struct
+import hashlib
+import tempfile
+from array import array
+
+from automatas import NFA, DFA, CompiledDFA
+from structures import parse_label
+
+
+# file format
+MAGIC_DFA = b'AFD\x00'
+MAGIC_NFA = b'AFN\x00'
+VERSION = 4
+
+# header: magic, version, flags, states, symbols, initial state, alphabet bytes
+HEADER = struct.Struct('<4sHHIIII')
+
+# alphabet entry: byte length of the label, then its utf-8 text
+LABEL = struct.Struct('<I')
+
+FLAG_BIG_ENDIAN = 1
+FLAG_TOKENS = 2
+
+DEFAULT_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'automatas')
+
+
+def pad(offset):
+    return (offset + 3) & ~3
+
+
+def encode_alphabet(symbols):
+    # length prefixed, so any label (even a plain '\x00') round trips
+    labels = [str(symbol).encode('utf-8') for symbol in symbols]
+    
+    return b''.join(LABEL.pack(len(label)) + label for label in labels)
+
+
+def decode_alphabet(data):
+    # class labels are stored as their canonical text
+    data = bytes(data)
+    symbols = []
+    offset = 0
+    
+    while offset < len(data):
+        size, = LABEL.unpack_from(data, offset)
+        offset += LABEL.size
+        
+        if offset + size > len(data):
+            raise ValueError("Alfabeto truncado")
+        
+        symbols.append(data[offset:offset + size].decode('utf-8'))
+        offset += size
+    
+    return symbols
+
+
+def dump(automata, path):
+    """
+    Escribe un autómata en el formato binario compilado.
+    
+    Params:
+        -> automata (DFA | CompiledDFA | NFA): autómata a guardar
+        -> path (string): ruta del archivo
+    """
+    if isinstance(automata, NFA):
+        data = dump_nfa(automata)
+    else:
+        data = dump_dfa(automata)
+    
+    # write a private temporary file and rename it, so readers never see half a file
+    # and concurrent writers of the same entry never share an inode
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        
+        raise
+
+
+def dump_dfa(automata):
+    compiled = automata.compile() if isinstance(automata, DFA) else automata
+    
+    flags = FLAG_BIG_ENDIAN if sys.byteorder == 'big' else 0
+    flags |= FLAG_TOKENS if compiled.tokens is not None else 0
+    
+    alphabet = encode_alphabet(compiled.symbols)
+    
+    header = HEADER.pack(MAGIC_DFA, VERSION, flags, compiled.n_states, len(compiled.symbols), compiled.initial_state, len(alphabet))
+    body = header + alphabet
+    body += b'\x00' * (pad(len(body)) - len(body))
+    
+    # table and tokens are written in native byte order, the flag records which one
+    body += array('i', compiled.table).tobytes()
+    
+    if compiled.tokens is not None:
+        body += array('i', compiled.tokens).tobytes()
+    
+    body += bytes(compiled.accepting)
+    
+    return body
+
+
+def dump_nfa(nfa):
+    ids = {state: i for i, state in enumerate(nfa.states)}
+    symbols = [symbol for symbol in nfa.symbols if symbol != 'ε']
+    columns = {symbol: i for i, symbol in enumerate(symbols)}
+    epsilon = len(symbols)
+    
+    # compressed rows: offsets per state, then (column, target) pairs, ε is the last column
+    offsets = array('i', [0])
+    edges = array('i')
+    
+    for state in nfa.states:
+        for symbol, value in nfa.adjacency.get(state, {}).items():
+            for x in value:
+                edges.append(columns.get(symbol, epsilon))
+                edges.append(ids[x])
+        
+        offsets.append(len(edges) // 2)
+    
+    accepting = bytearray(len(nfa.states))
+    for state in nfa.terminal_states:
+        accepting[ids[state]] = 1
+    
+    flags = FLAG_BIG_ENDIAN if sys.byteorder == 'big' else 0
+    alphabet = encode_alphabet(symbols)
+    
+    header = HEADER.pack(MAGIC_NFA, VERSION, flags, len(nfa.states), len(symbols), ids[nfa.initial_state], len(alphabet))
+    body = header + alphabet
+    body += b'\x00' * (pad(len(body)) - len(body))
+    
+    return body + offsets.tobytes() + edges.tobytes() + bytes(accepting)
+
+
+def ints(view, offset, count, swap):
+    if swap:
+        # foreign byte order: the only case where the data is copied
+        table = array('i', bytes(view[offset:offset + 4 * count]))
+        table.byteswap()
+        
+        return table
+    
+    return view[offset:offset + 4 * count].cast('i')
+
+
+def load(path):
+    """
+    Carga un autómata guardado con dump(). Los DFA se mapean en memoria: la tabla,
+    los estados de aceptación y los tokens son vistas sobre el archivo, sin crear
+    objetos por estado.
+    
+    Params:
+        -> path (string): ruta del archivo
+    """
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    view = memoryview(data)
+    
+    if len(view) < HEADER.size:
+        raise ValueError("Archivo de autómata truncado: " + path)
+    
+    magic, version, flags, n, k, initial, alphabet_size = HEADER.unpack_from(view, 0)
+    
+    if magic not in (MAGIC_DFA, MAGIC_NFA) or version != VERSION:
+        raise ValueError("Formato de autómata no soportado: " + path)
+    
+    swap = bool(flags & FLAG_BIG_ENDIAN) != (sys.byteorder == 'big')
+    
+    offset = HEADER.size
+    
+    if len(view) < pad(offset + alphabet_size):
+        raise ValueError("Archivo de autómata truncado: " + path)
+    
+    symbols = [parse_label(symbol) for symbol in decode_alphabet(view[offset:offset + alphabet_size])]
+    offset = pad(offset + alphabet_size)
+    
+    if len(symbols) != k:
+        raise ValueError("Alfabeto inconsistente con el encabezado: " + path)
+    
+    if magic == MAGIC_NFA:
+        return load_nfa(view, offset, n, k, initial, symbols, swap, path)
+    
+    # the header fixes the size of everything that follows
+    expected = offset + 4 * (n + 1) * k + (4 * (n + 1) if flags & FLAG_TOKENS else 0) + n + 1
+    
+    if len(view) != expected:
+        raise ValueError("Archivo de autómata truncado o corrupto: " + path)
+    
+    table = ints(view, offset, (n + 1) * k, swap)
+    offset += 4 * (n + 1) * k
+    
+    tokens = None
+    if flags & FLAG_TOKENS:
+        tokens = ints(view, offset, n + 1, swap)
+        offset += 4 * (n + 1)
+    
+    accepting = view[offset:offset + n + 1]
+    
+    compiled = CompiledDFA(symbols, table, initial, accepting, tokens)
+    
+    # the views keep the mapping alive
+    compiled.buffer = data
+    
+    return compiled
+
+
+def load_nfa(view, offset, n, k, initial, symbols, swap, path):
+    if len(view) < offset + 4 * (n + 1):
+        raise ValueError("Archivo de autómata truncado: " + path)
+    
+    offsets = ints(view, offset, n + 1, swap)
+    offset += 4 * (n + 1)
+    
+    if len(view) != offset + 8 * offsets[n] + n:
+        raise ValueError("Archivo de autómata truncado o corrupto: " + path)
+    
+    edges = ints(view, offset, 2 * offsets[n], swap)
+    offset += 8 * offsets[n]
+    
+    accepting = view[offset:offset + n]
+    labels = symbols + ['ε']
+    
+    adjacency = {state: {} for state in range(n)}
+    for state in range(n):
+        for e in range(offsets[state], offsets[state + 1]):
+            adjacency[state].setdefault(labels[edges[2 * e]], []).append(edges[2 * e + 1])
+    
+    t_function = {(state, symbol): value for state, row in adjacency.items() for symbol, value in row.items()}
+    terminal_states = [state for state in range(n) if accepting[state]]
+    
+    nfa = NFA(symbols, states=list(range(n)), tfunc=t_function, istate=initial, tstate=terminal_states, adjacency=adjacency)
+    nfa.build_closure_cache()
+    
+    return nfa
+
+
+
+
+class AutomataCache(object):
+    """
+    CLASS AUTOMATA CACHE
+    
+    Caché en disco de autómatas compilados. Cada archivo se identifica con un hash
+    de la expresión regular, la tabla de operadores y el método de construcción,
+    de modo que un cambio en cualquiera de ellos invalida la entrada.
+    
+    Params:
+        -> directory (string): carpeta donde se guardan los archivos
+    """
+    def __init__(self, directory=DEFAULT_CACHE):
+        self.directory = directory
+        
+        os.makedirs(directory, exist_ok=True)
+    
+    
+    def key(self, regex, operators, method):
+        data = json.dumps([VERSION, regex, sorted(operators.items()), method], ensure_ascii=False)
+        
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+    
+    
+    def path(self, regex, operators, method):
+        return os.path.join(self.directory, self.key(regex, operators, method) + '.fa')
+    
+    
+    def get(self, regex, operators, method):
+        path = self.path(regex, operators, method)
+        
+        try:
+            return load(path)
+        except OSError:
+            return None
+        except (ValueError, struct.error):
+            # unreadable entry (truncated, corrupt or an old format): drop it so it gets rebuilt
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            
+            return None
+    
+    
+    def put(self, regex, operators, method, automata):
+        dump(automata, self.path(regex, operators, method))
+    
+    
+    def load_or_build(self, regex, operators, method, build):
+        automata = self.get(regex, operators, method)
+        
+        if automata is None:
+            self.put(regex, operators, method, build())
+            automata = load(self.path(regex, operators, method))
+        
+        return automata
@@ -1,10 +1,102 @@
-import copy
+import re
+import weakref
+from array import array
+from bisect import bisect_right
+from timeit import default_timer as timer
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import OrderedDict
 
-import numpy as np
-from queue import LifoQueue
 
+# default operators and precedence
+OPERATORS = {
+    '|': 1,
+    '^': 2,
+    '*': 3,
+    '?': 3,
+    '+': 3,
+    '{': 3
+}
 
-class SyntaxTree(object):
+# token kinds of the parser, parentheses are their own kind
+SYMBOL = 'symbol'
+OPERATOR = 'operator'
+
+# postfix operators, every other operator is binary ({m,n} is unary too)
+UNARY = ('*', '?', '+')
+
+# counted repetition: {m}, {m,}, {,n} and {m,n}
+REPEAT = re.compile(r'\{(\d*)(,(\d*))?\}')
+
+# default limit of NFA states a pattern may expand to
+MAX_STATES = 1 << 20
+
+# escapes that stand for a single character, and for a class
+CONTROL = {'n': '\n', 't': '\t', 'r': '\r', 'f': '\f', 'v': '\v', '0': '\0'}
+SHORTHANDS = {
+    'd': [('0', '9')],
+    'w': [('0', '9'), ('A', 'Z'), ('_', '_'), ('a', 'z')],
+    's': [('\t', '\r'), (' ', ' ')],
+}
+
+# last code point, negated classes are complemented up to here
+MAX_CHAR = 0x10FFFF
+
+# end marker of the direct method, a private use character that never appears in the input
+END = '\ue000'
+
+# sink for the objects created inside a profile() block
+ACTIVE_SINK = ContextVar('active_sink', default=None)
+
+
+
+
+class Traceable(object):
+    """
+    CLASS TRACEABLE
+    
+    Agrega un sumidero (sink) de eventos de traza a una clase. Sin sink los
+    puntos de traza solo evalúan un `is not None`; con sink cada evento es un
+    diccionario con la fase, la operación, el tiempo transcurrido y detalles.
+    
+    Params:
+        -> sink (object): objeto con un método emit(event), o None
+    """
+    sink = None
+    
+    def attach(self, sink):
+        # without an explicit sink, the one of the enclosing profile() block is used
+        active = ACTIVE_SINK.get()
+        self.sink = sink if sink is not None else active
+        
+        # the block detaches what it profiled when it exits
+        if self.sink is not None and self.sink is active:
+            active.adopt(self)
+    
+    
+    def trace_start(self):
+        return timer() if self.sink is not None else None
+    
+    
+    def emit(self, phase, operation, start=None, **details):
+        event = {
+            'phase': phase,
+            'operation': operation,
+            'elapsed': timer() - start if start is not None else None,
+        }
+        event.update(details)
+        
+        self.sink.emit(event)
+    
+    
+    def tally(self, phase, **counters):
+        # counters are computed once per operation, never inside the hot loops
+        self.sink.emit({'phase': phase, 'operation': 'counters', 'elapsed': None, 'counters': counters})
+
+
+
+
+class SyntaxTree(Traceable):
     """
     CLASS SYNTAX TREE
     
@@ -15,22 +107,28 @@ class SyntaxTree(object):
         -> operators (list): lista de operadores reconocidos por el árbol
         -> regex (string): expresión regular que genera un lenguaje
         -> root (Node): nodo raíz del árbol
+        -> max_states (int): estados de Thompson que la expresión puede generar
+        -> end (string): marcador de fin concatenado a toda la expresión, o None
     """
-    def __init__(self, operators, regex, direct=False):
+    def __init__(self, operators, regex, direct=False, sink=None, max_states=MAX_STATES, end=None):
+        self.attach(sink)
+        self.max_states = max_states
+        self.end = end
+        
         ## language stuff
         self.operators = operators
-        self.symbols = list(set([char for char in regex if char not in operators if char != '(' and char != ')']))
+        self.symbols = {}
         self.regex = regex
-        self.postfix = ""
+        self.tokens = []
         
         ## options
         self.direct = direct
         
         ## structure stuff
         self.root = None
+        self.nodes = None
         
         ## transformations to regex
-        self.explicit_concat()
         self.to_postfix()
         direct and self.clean_postfix()
         self.build_tree()
@@ -40,61 +138,125 @@ class SyntaxTree(object):
         
     def get_precedence(self, c):
         try:
-            precedence = self.operators[c]
+            precedence = self.operators[c[0] if is_repeat(c) else c]
         except:
             precedence = 0
             
         return precedence;
     
     
-    def explicit_concat(self):
-        new_regex = ""
-        for i in range(len(self.regex)):
-            new_regex += self.regex[i]
-            try:
-                if (self.regex[i] in self.symbols and self.regex[i + 1] in self.symbols) \
-                    or (self.regex[i] not in ['|', '('] and self.regex[i + 1] in self.symbols + ['(']):
-                        new_regex += '^'
-            except:
-                pass
+    def error(self, message):
+        # raised, never exit(): the tree is built inside compile() and other host processes
+        raise ValueError(message)
+    
     
-        self.regex = new_regex
+    def tokenize(self):
+        # single pass: symbols, escapes and classes become one operand token each,
+        # and the implicit concatenation is inserted on the way
+        regex = self.regex
+        tokens = []
+        i = 0
+        
+        while i < len(regex):
+            char = regex[i]
+            
+            if char == '\\':
+                if i + 1 == len(regex):
+                    self.error("Error sintáctico, la expresión termina con un escape incompleto")
+                
+                token = (SYMBOL, escape(regex[i + 1]))
+                i += 2
+            
+            elif char == '[':
+                label, i = parse_class(regex, i)
+                
+                if label is None:
+                    self.error("Error sintáctico, clase de caracteres sin cerrar o vacía")
+                
+                token = (SYMBOL, label)
+            
+            elif char == '{' and char in self.operators and repeat_match(regex, i):
+                match = repeat_match(regex, i)
+                token = (OPERATOR, repeat_text(self, match))
+                i = match.end()
+            
+            elif char == '(' or char == ')':
+                token = (char, char)
+                i += 1
+            
+            elif char in self.operators and char != '{':
+                token = (OPERATOR, char)
+                i += 1
+            
+            else:
+                token = (SYMBOL, char)
+                i += 1
+            
+            # an operand or '(' right after an operand, ')' or a unary operator is a concatenation
+            if tokens and token[0] in (SYMBOL, '('):
+                kind, value = tokens[-1]
+                
+                if kind == SYMBOL or kind == ')' or (kind == OPERATOR and is_unary(value)):
+                    tokens.append((OPERATOR, '^'))
+            
+            tokens.append(token)
+        
+        # the end marker is added as a token, so the user's text is never reinterpreted
+        if self.end is not None and tokens:
+            tokens = [('(', '(')] + tokens + [(')', ')'), (OPERATOR, '^'), (SYMBOL, self.end)]
         
+        return tokens
         
+        
+    @property
+    def postfix(self):
+        # the text is only rendered when someone reads it (a trace or a caller)
+        return render(self.tokens)
+    
+    
     def clean_postfix(self):
-        print(Colors.OKBLUE + "[INFO] " + Colors.ENDC + "Cleaning and refactoring postfix")
-        new_postfix = ""
+        start = self.trace_start()
+        tokens = []
         
-        for char in self.postfix:
-            if char == '?':
-                new_postfix += 'ε|'
-                self.symbols.append('ε')
+        for token in self.tokens:
+            if token == (OPERATOR, '?'):
+                tokens.append((SYMBOL, 'ε'))
+                tokens.append((OPERATOR, '|'))
             else:
-                new_postfix += char
+                tokens.append(token)
         
-        self.postfix = new_postfix
+        # ε is added to the symbols once
+        'ε' not in self.symbols and (SYMBOL, 'ε') in tokens and self.symbols.append('ε')
+        
+        self.tokens = tokens
+        
+        self.sink is not None and self.emit('tree', 'clean', start, postfix=self.postfix)
             
     
     
     def to_postfix(self):
         operator_stack = Stack()
+        start = self.trace_start()
         
-        print(Colors.OKBLUE + "[INFO] " + Colors.ENDC + "Transforming regex to postfix")
-        for char in self.regex:
-            if char in self.symbols:
-                self.postfix += char
+        # shunting-yard over the token array
+        postfix = []
                 
-            elif char == '(':
-                operator_stack.push(char)
+        for token in self.tokenize():
+            kind, value = token
                 
-            elif char == ')':
-                while operator_stack.top() != '(':
-                    self.postfix += operator_stack.pop()
+            if kind == SYMBOL:
+                postfix.append(token)
+                self.symbols.setdefault(value, None)
                     
-                    if operator_stack.is_empty():
-                        print(Colors.FAIL + "[ERROR] " + Colors.ENDC + "Error sintáctico, falta un paréntesis en la expresión")
-                        exit()
+            elif kind == '(':
+                operator_stack.push(token)
                     
+            elif kind == ')':
+                while not operator_stack.is_empty() and operator_stack.top()[0] != '(':
+                    postfix.append(operator_stack.pop())
+                
+                if operator_stack.is_empty():
+                    self.error("Error sintáctico, falta un paréntesis en la expresión")
                     
                 operator_stack.pop()
     
@@ -102,79 +264,255 @@ class SyntaxTree(object):
                 while not operator_stack.is_empty():
                     top = operator_stack.top()
                     
-                    top_precedence = self.get_precedence(top)
-                    char_precedence = self.get_precedence(char)
-                    
-                    if (top_precedence >= char_precedence):
-                        self.postfix += operator_stack.pop()
+                    if top[0] == OPERATOR and self.get_precedence(top[1]) >= self.get_precedence(value):
+                        postfix.append(operator_stack.pop())
                     else:
                         break
                         
-                operator_stack.push(char)
+                operator_stack.push(token)
                 
         while not operator_stack.is_empty():
-            self.postfix += operator_stack.pop()
+            token = operator_stack.pop()
+            
+            if token[0] == '(':
+                self.error("Error sintáctico, falta un paréntesis en la expresión")
+            
+            postfix.append(token)
+        
+        self.symbols = list(self.symbols)
+        self.tokens = postfix
             
-        print(Colors.OKBLUE + "[INFO] " + Colors.ENDC + "Postfix obtained: " + self.postfix)
+        self.sink is not None and self.emit('tree', 'postfix', start, postfix=self.postfix)
                     
     
+    def expansion(self):
+        """
+        Cantidad de estados que Thompson generaría para la expresión, calculada
+        sobre el postfix sin construir nada. Las repeticiones {m,n} multiplican el
+        tamaño de su operando.
+        """
+        sizes = []
+        
+        for kind, value in self.tokens:
+            if kind == SYMBOL:
+                sizes.append(2)
+                continue
+            
+            # malformed expressions are reported by build_tree
+            if len(sizes) < (1 if is_unary(value) else 2):
+                return 0
+            
+            if is_repeat(value):
+                m, n = repeat_bounds(value)
+                a = sizes.pop()
+                
+                # a^m, then n - m nested optionals (or a star): each concatenation merges one state
+                parts = m * a + ((n - m) * (a + 4) if n is not None else a + 2)
+                count = m + (n - m if n is not None else 1)
+                sizes.append(parts - count + 1 if count else 2)
+            
+            elif value in UNARY:
+                sizes.append(sizes.pop() + (4 if value == '?' else 2))
+            
+            else:
+                b, a = sizes.pop(), sizes.pop()
+                sizes.append(a + b - 1 if value == '^' else a + b + 2)
+        
+        return max(sizes) if sizes else 0
+    
+    
+    def clone(self, node):
+        # iterative copy of a subtree, repeated fragments get their own positions
+        copies = {None: None}
+        
+        for current in self.postorder(node):
+            copy = Node(current.data, left=copies[current.left], right=copies[current.right])
+            copy.left is not None and setattr(copy.left, 'parent', copy)
+            copy.right is not None and setattr(copy.right, 'parent', copy)
+            copies[current] = copy
+        
+        return copies[node]
+    
+    
+    def join(self, data, left, right):
+        new = Node(data, left=left, right=right)
+        
+        if left is not None:
+            left.parent = new
+        if right is not None:
+            right.parent = new
+        
+        return new
+    
+    
+    def optional(self, node):
+        # the direct method has no '?' node, it is written as (node|ε)
+        if self.direct:
+            return self.join('|', node, Node('ε'))
+        
+        return self.join('?', None, node)
+    
+    
+    def repeat(self, node, value):
+        m, n = repeat_bounds(value)
+        
+        if m == 0 and n == 0:
+            'ε' not in self.symbols and self.symbols.append('ε')
+            return Node('ε')
+        
+        # a{m,n} = a...a (a(a(a)?)?)?, a{m,} = a...a a*
+        tail = None
+        
+        if n is None:
+            tail = self.join('*', None, self.clone(node) if m else node)
+        else:
+            for i in range(n - m):
+                copy = self.clone(node) if m or i < n - m - 1 else node
+                tail = self.optional(copy if tail is None else self.join('^', copy, tail))
+        
+        head = None
+        
+        for i in range(m):
+            copy = node if i == 0 else self.clone(node)
+            head = copy if head is None else self.join('^', head, copy)
+        
+        if head is None or tail is None:
+            return head if tail is None else tail
+        
+        return self.join('^', head, tail)
+    
+    
     def build_tree(self):
         tree_stack = Stack()
+        start = self.trace_start()
+        
+        # the budget is checked before any node is created
+        states = self.expansion()
+        
+        if states > self.max_states:
+            raise ValueError("La expresión genera %d estados, el límite es %d" % (states, self.max_states))
         
-        print(Colors.OKBLUE + "[INFO] " + Colors.ENDC + "Building tree")
-        for char in self.postfix:
-            if char in self.symbols:
-                tree_stack.push(Node(char))
+        for kind, value in self.tokens:
+            if kind == SYMBOL:
+                tree_stack.push(Node(value))
             else:
-                if char in ['*', '?', '+']:
+                if is_unary(value):
                     if tree_stack.get_size() > 0:
-                        if self.direct and char == '+':
-                                a = tree_stack.pop()
-                                a_copy = copy.deepcopy(a)
-                                
-                                kleene = Node('*', right=a_copy)
+                        # '+' stays a single node in direct mode too, its subtree is never copied
+                        right = tree_stack.pop()
+                        
+                        if is_repeat(value):
+                            tree_stack.push(self.repeat(right, value))
+                            continue
                                 
-                                concat = Node('^', right=kleene, left=a)
+                        new = Node(value, right=right)
                                 
-                                a_copy.parent = kleene
-                                kleene.parent = concat
-                                a.parent = concat
+                        right.parent = new
                                 
-                                tree_stack.push(concat)
-                        else:
-                            right = tree_stack.pop()
-                        
-                            new = Node(char, right=right)
-                        
-                            right.parent = new
-                        
-                            tree_stack.push(new)
+                        tree_stack.push(new)
                     else:
-                        print(Colors.FAIL + "[ERROR] " + Colors.ENDC + "Operación " + char + " incompleta, insuficientes parámetros")
-                        exit()
+                        self.error("Operación " + value + " incompleta, insuficientes parámetros")
                 else:
                     if tree_stack.get_size() > 1:
                         right = tree_stack.pop()
                         left = tree_stack.pop()
                     
-                        new = Node(char, right=right, left=left)
+                        new = Node(value, right=right, left=left)
                     
                         right.parent = new
                         left.parent = new
                     
                         tree_stack.push(new)
                     else:
-                        print(Colors.FAIL + "[ERROR] " + Colors.ENDC + "Operación CONCAT u OR incompleta, falta un símbolo")
-                        exit()
+                        self.error("Operación CONCAT u OR incompleta, falta un símbolo")
+        
+        if tree_stack.get_size() != 1:
+            self.error("Error sintáctico, expresión vacía o incompleta")
         
         self.root = tree_stack.pop()
         
+        self.sink is not None and self.emit('tree', 'build', start, height=self.height())
+    
+    
+    def partition(self, exclude=()):
+        # equivalence classes of the symbols (and classes) used by the expression
+        return Alphabet.partition(symbol for symbol in self.symbols if symbol not in exclude)
+        
+    
+    def postorder(self, node):
+        # explicit stack instead of recursion, deep trees do not hit the recursion limit
+        order = []
+        stack = [node] if node is not None else []
+        
+        while stack:
+            current = stack.pop()
+            order.append(current)
+            
+            current.left is not None and stack.append(current.left)
+            current.right is not None and stack.append(current.right)
+        
+        # root, right, left reversed is left, right, root
+        order.reverse()
+        
+        return order
+    
+    
+    def annotate(self):
+        # positions, nullable, firstpos and lastpos are computed once per tree
+        if self.nodes is not None:
+            return self.nodes
+        
+        self.nodes = self.postorder(self.root)
+        
+        for node in self.nodes:
+            left, right = node.left, node.right
+            
+            if left is None and right is None:
+                # ε matches the empty string and has no position
+                if node.data == 'ε':
+                    node.nullable = True
+                    node.first = node.last = 0
+                else:
+                    node.pos = self.pos
+                    self.pos += 1
+                    
+                    # a leaf stands for its own position, no bitset is built for it
+                    node.nullable = False
+                    node.first = node.last = node
+            
+            # None is a union of both children, resolved into a bitset only when read
+            elif node.data == '|':
+                node.nullable = right.nullable or left.nullable
+                
+                node.first = node.last = None
+            
+            elif node.data == '^':
+                node.nullable = right.nullable and left.nullable
+                
+                node.first = None if left.nullable else share(left, 'first')
+                node.last = None if right.nullable else share(right, 'last')
+            
+            elif node.data == '*':
+                node.nullable = True
+                node.first = share(right, 'first')
+                node.last = share(right, 'last')
+        
+            elif node.data == '+':
+                # a+ is a·a* without copying a: same positions, nullable only if a is
+                node.nullable = right.nullable
+                node.first = share(right, 'first')
+                node.last = share(right, 'last')
+        
+        return self.nodes
+    
     
     def _height(self, node):
-        if node is None:
-            return 0
-        else:
-            return 1 + max(self._height(node.left), self._height(node.right))    
+        heights = {None: 0}
+        
+        for current in self.postorder(node):
+            heights[current] = 1 + max(heights[current.left], heights[current.right])
+        
+        return heights[node]
     
     
     def height(self):
@@ -191,47 +529,11 @@ class SyntaxTree(object):
         if nodes is None:
             nodes = []
             
-        self.traverse_postorder(node.left, reachable, nodes)
-        self.traverse_postorder(node.right, reachable, nodes)
-        
-        reachable.append(node.data)
-        nodes.append(node)
+        # only the direct method reads positions, annotations are cached so traversing again does not renumber them
+        order = self.annotate() if node is self.root and self.direct else self.postorder(node)
         
-        if node.data in self.symbols:
-            # define pos
-            node.pos = self.pos
-            self.pos += 1
-            
-            # define nullable
-            if node.data == 'ε':
-                node.nullable = True
-            else:
-                node.nullable = False
-                
-            # define first and last pos
-            node.firstpos = [node.pos]
-            node.lastpos = [node.pos]
-            
-        else:
-            if node.data == '|':
-                node.nullable = node.right.nullable or node.left.nullable
-                
-                node.firstpos = list(set(node.right.firstpos + node.left.firstpos))
-                node.lastpos = list(set(node.right.lastpos + node.left.lastpos))
-                
-            elif node.data == '^':
-                node.nullable = node.right.nullable and node.left.nullable
-                
-                node.firstpos = list(set(node.right.firstpos + node.left.firstpos)) if node.left.nullable else node.left.firstpos
-                node.lastpos = list(set(node.right.lastpos + node.left.lastpos)) if node.right.nullable else node.right.lastpos
-                
-            elif node.data == '*':
-                node.nullable = True
-                node.firstpos = node.right.firstpos
-                node.lastpos = node.right.lastpos
-            
-            else:
-                pass
+        nodes.extend(order)
+        reachable.extend(current.data for current in order)
         
         return nodes if full else reachable 
     
@@ -244,10 +546,16 @@ class SyntaxTree(object):
             
     
     def print_tree(self, node):
-        if node is not None:
-            print(node.data)
-            self.print_tree(node.left)
-            self.print_tree(node.right)
+        stack = [node]
+        
+        # preorder: node, left subtree, right subtree
+        while stack:
+            current = stack.pop()
+            
+            if current is not None:
+                print(current.data)
+                stack.append(current.right)
+                stack.append(current.left)
 
 
 
@@ -256,7 +564,11 @@ class Node(object):
     """
     CLASS NODE
     
-    Una clase nodo, almacena información de un nodo en un árbol binario.
+    Una clase nodo, almacena información de un nodo en un árbol binario. Usa
+    __slots__ para no cargar un diccionario por nodo. Las posiciones primeras y
+    últimas no se copian en cada nodo: se guarda la hoja o el nodo que tiene el
+    mismo conjunto (o None para la unión de los hijos), y el bitset se arma al
+    leer firstmask o lastmask por primera vez.
     
     Params:
         -> parent (Node): nodo padre (si no tiene es un nodo raíz)
@@ -264,17 +576,62 @@ class Node(object):
         -> right (Node): nodo hijo del lado derecho
         -> data (string): símbolo u operador que el nodo almacena
     """
+    __slots__ = ('data', 'left', 'right', 'parent', 'last', 'first', 'nullable', 'pos')
+    
     def __init__(self, data, parent=None, left=None, right=None):
         self.data = data
         self.left = left
         self.right = right
         self.parent = parent
         
-        self.lastpos = []
-        self.firstpos = []
-        self.followpos = []
+        self.last = 0
+        self.first = 0
         self.nullable = False
         self.pos = None
+    
+    
+    @property
+    def firstmask(self):
+        first = self.first
+        
+        if isinstance(first, int):
+            return first
+        
+        if first is not None and first.pos is not None:
+            return 1 << first.pos
+        
+        self.first = union_mask(self, 'first')
+        
+        return self.first
+    
+    
+    @property
+    def lastmask(self):
+        last = self.last
+        
+        if isinstance(last, int):
+            return last
+        
+        if last is not None and last.pos is not None:
+            return 1 << last.pos
+        
+        self.last = union_mask(self, 'last')
+        
+        return self.last
+    
+    
+    @property
+    def firstpos(self):
+        first = self.first
+        
+        return [first.pos] if first is not None and not isinstance(first, int) and first.pos is not None else from_bitset(self.firstmask)
+    
+    
+    @property
+    def lastpos(self):
+        last = self.last
+        
+        return [last.pos] if last is not None and not isinstance(last, int) and last.pos is not None else from_bitset(self.lastmask)
 
 
 
@@ -283,29 +640,27 @@ class Stack(object):
     """
     CLASS STACK
     
-    Esta clase construye un stack utilizando la librería collections y LifoQueue
-    e implementa las funcionalidades básicas de un stack (push, pop, get_size, is_empty)
+    Esta clase construye un stack sobre una lista de python (sin los locks de
+    LifoQueue) e implementa las funcionalidades básicas de un stack (push, pop,
+    get_size, is_empty)
     
     Params:
         None
     """
     def __init__(self):
-        self.stack = LifoQueue()
+        self.stack = []
        
         
     def push(self, item):
-        self.stack.put(item)
+        self.stack.append(item)
         
     
     def pop(self):
-        return self.stack.get()
+        return self.stack.pop()
     
     
     def top(self):
-        top = self.pop()
-        self.stack.put(top)
-        
-        return top
+        return self.stack[-1]
     
     
     def snoc(self):
@@ -316,11 +671,599 @@ class Stack(object):
     
     
     def get_size(self):
-        return self.stack.qsize()
+        return len(self.stack)
     
     
     def is_empty(self):
-        return self.stack.empty()
+        return not self.stack
+
+
+
+
+class ClosureCache(object):
+    """
+    CLASS CLOSURE CACHE
+    
+    Tabla de ε-cerraduras de un autómata. Guarda la cerradura de cada estado
+    (calculada la primera vez que se pide) y memoriza las cerraduras de conjuntos
+    de estados, indexadas por un frozenset, con desalojo LRU.
+    
+    Params:
+        -> maxsize (int): cantidad máxima de conjuntos memorizados (None = sin límite)
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.states = {}
+        self.sets = OrderedDict()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        
+    def get(self, key):
+        try:
+            closure = self.sets[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        self.sets.move_to_end(key)
+        
+        return closure
+    
+    
+    def put(self, key, closure):
+        if self.maxsize == 0:
+            return
+        
+        self.sets[key] = closure
+        self.sets.move_to_end(key)
+        
+        if self.maxsize is not None and len(self.sets) > self.maxsize:
+            self.sets.popitem(last=False)
+            self.evictions += 1
+            
+            
+    def clear(self):
+        self.sets.clear()
+        self.hits = self.misses = self.evictions = 0
+        
+    
+    def info(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.sets),
+            'maxsize': self.maxsize,
+        }
+    
+    
+    def __len__(self):
+        return len(self.sets)
+
+
+
+
+class CharClass(str):
+    """
+    CLASS CHAR CLASS
+    
+    Clase de caracteres ([a-z0-9], \\d, ...) que se usa como una sola etiqueta de
+    transición. Es un str con su forma canónica, así que se imprime, compara y guarda
+    como cualquier otro símbolo, pero `char in clase` prueba si el caracter cae en
+    alguno de sus rangos.
+    
+    Params:
+        -> ranges (list): pares (inicio, fin) de caracteres, inclusivos
+    """
+    def __new__(cls, ranges):
+        merged = []
+        
+        # sorted, disjoint and non adjacent ranges give one canonical text per set
+        for lo, hi in sorted(ranges):
+            if merged and ord(lo) <= ord(merged[-1][1]) + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+            else:
+                merged.append((lo, hi))
+        
+        text = ''.join(quote(lo) if lo == hi else quote(lo) + '-' + quote(hi) for lo, hi in merged)
+        
+        self = str.__new__(cls, '[' + text + ']')
+        self.ranges = merged
+        self.starts = [lo for lo, hi in merged]
+        
+        return self
+    
+    
+    def __contains__(self, char):
+        i = bisect_right(self.starts, char) - 1
+        
+        return i >= 0 and char <= self.ranges[i][1]
+    
+    
+    def __reduce__(self):
+        return (parse_label, (str(self),))
+    
+    
+    def chars(self):
+        return [chr(c) for lo, hi in self.ranges for c in range(ord(lo), ord(hi) + 1)]
+
+
+
+
+def quote(char):
+    if char == '\0':
+        return '\\0'
+    
+    return '\\' + char if char in '\\]-^[' else char
+
+
+def complement(ranges):
+    merged = CharClass(ranges).ranges
+    result = []
+    low = 0
+    
+    for lo, hi in merged:
+        if ord(lo) > low:
+            result.append((chr(low), chr(ord(lo) - 1)))
+        low = ord(hi) + 1
+    
+    if low <= MAX_CHAR:
+        result.append((chr(low), chr(MAX_CHAR)))
+    
+    return result
+
+
+def shorthand(char):
+    # \d \w \s and their negations \D \W \S, as ranges
+    if char in SHORTHANDS:
+        return SHORTHANDS[char]
+    
+    if char.lower() in SHORTHANDS:
+        return complement(SHORTHANDS[char.lower()])
+    
+    return None
+
+
+def escape(char):
+    # an escaped character outside a class: a shorthand class, a control character or itself
+    ranges = shorthand(char)
+    
+    if ranges is not None:
+        return CharClass(ranges)
+    
+    return CONTROL.get(char, char)
+
+
+def parse_class(regex, i):
+    """
+    Lee una clase [...] que empieza en regex[i]. Devuelve la etiqueta (un símbolo si
+    la clase tiene un solo caracter) y la posición siguiente, o None si no cierra.
+    """
+    ranges = []
+    i += 1
+    
+    # [^...] matches every character outside the listed ones
+    negated = i < len(regex) and regex[i] == '^'
+    i += negated
+    
+    while i < len(regex) and regex[i] != ']':
+        char = regex[i]
+        
+        if char == '\\' and i + 1 < len(regex):
+            i += 1
+            
+            if shorthand(regex[i]) is not None:
+                ranges += shorthand(regex[i])
+                i += 1
+                continue
+            
+            char = CONTROL.get(regex[i], regex[i])
+        
+        i += 1
+        
+        # a '-' between two characters is a range, at the ends it is literal
+        if i + 1 < len(regex) and regex[i] == '-' and regex[i + 1] != ']':
+            hi = regex[i + 1]
+            i += 2
+            
+            if hi == '\\' and i < len(regex):
+                hi = CONTROL.get(regex[i], regex[i])
+                i += 1
+            
+            ranges.append((char, hi) if char <= hi else (hi, char))
+        else:
+            ranges.append((char, char))
+    
+    if i == len(regex) or not ranges:
+        return None, i
+    
+    if negated:
+        ranges = complement(ranges)
+        
+        if not ranges:
+            return None, i
+    
+    label = CharClass(ranges)
+    
+    return (label.ranges[0][0] if len(label.ranges) == 1 and label.ranges[0][0] == label.ranges[0][1] else label), i + 1
+
+
+def parse_label(text):
+    # symbols are single characters, longer labels are the canonical text of a class
+    return parse_class(text, 0)[0] if len(text) > 1 else text
+
+
+def is_repeat(value):
+    return value[0] == '{' and len(value) > 1
+
+
+def is_unary(value):
+    return value in UNARY or is_repeat(value)
+
+
+def repeat_match(regex, i):
+    # '{' without a number in it ('{}', '{,}', '{a}') is a literal brace
+    match = REPEAT.match(regex, i)
+    
+    return match if match and (match.group(1) or match.group(3)) else None
+
+
+def repeat_text(tree, match):
+    m = int(match.group(1) or 0)
+    n = match.group(3)
+    
+    if n is None:
+        return '{%d}' % m
+    
+    if n == '':
+        return '{%d,}' % m
+    
+    if int(n) < m:
+        tree.error("Error sintáctico, repetición {%d,%s} con mínimo mayor al máximo" % (m, n))
+    
+    return '{%d,%d}' % (m, int(n))
+
+
+def repeat_bounds(value):
+    # '{m}' -> (m, m), '{m,}' -> (m, None), '{m,n}' -> (m, n)
+    m, comma, n = value[1:-1].partition(',')
+    
+    if not comma:
+        return int(m), int(m)
+    
+    return int(m), int(n) if n else None
+
+
+def render(tokens):
+    # postfix text for the traces, literal operators and specials are escaped back
+    return ''.join(
+        '\\' + value if kind == SYMBOL and not isinstance(value, CharClass) and value in '\\[]()*+?|^{}' else value
+        for kind, value in tokens
+    )
+
+
+class Alphabet(object):
+    """
+    CLASS ALPHABET
+    
+    Clasificador de caracteres en columnas. Cada columna es una clase disjunta
+    (un caracter o una CharClass) y un caracter se clasifica con un mapa de 256
+    entradas para latin-1 y una búsqueda binaria por rangos para el resto. Los
+    caracteres fuera de toda clase caen en la clase comodín "other", cuyo índice
+    es len(alphabet) y que siempre lleva al estado muerto, por eso no ocupa
+    columna en la tabla.
+    
+    Params:
+        -> classes (list): etiquetas disjuntas, una por columna
+    """
+    def __init__(self, classes):
+        self.labels = list(classes)
+        self.k = len(self.labels)
+        self.members = None
+        self.covers = None
+        self.other = None
+        
+        intervals = sorted(
+            (ord(lo), ord(hi), c) 
+            for c, label in enumerate(self.labels) 
+            for lo, hi in (label.ranges if isinstance(label, CharClass) else [(label, label)])
+        )
+        
+        self.starts = [lo for lo, hi, c in intervals]
+        self.ends = [hi for lo, hi, c in intervals]
+        self.ids = [c for lo, hi, c in intervals]
+        
+        # one byte per latin-1 character, k marks "other"
+        byte_map = [self.k] * 256
+        for lo, hi, c in intervals:
+            for code in range(lo, min(hi, 255) + 1):
+                byte_map[code] = c
+        
+        self.byte_map = bytes(byte_map) if self.k < 256 else array('i', byte_map)
+    
+    
+    @classmethod
+    def partition(cls, labels):
+        """
+        Parte el alfabeto en clases de equivalencia: dos caracteres quedan en la
+        misma clase si ninguna etiqueta los distingue. `members` guarda las
+        etiquetas de cada clase y `covers` las clases de cada etiqueta.
+        """
+        labels = [label for label in dict.fromkeys(labels) if label != 'ε']
+        
+        opens = {}
+        closes = {}
+        for label in labels:
+            for lo, hi in (label.ranges if isinstance(label, CharClass) else [(label, label)]):
+                opens.setdefault(ord(lo), []).append(label)
+                closes.setdefault(ord(hi) + 1, []).append(label)
+        
+        # sweep over the range boundaries, each elementary interval gets its label set
+        points = sorted(set(opens) | set(closes) | {0, MAX_CHAR + 1})
+        active = set()
+        signatures = {}
+        
+        for p, q in zip(points, points[1:]):
+            active.difference_update(closes.get(p, ()))
+            active.update(opens.get(p, ()))
+            
+            signatures.setdefault(frozenset(active), []).append((chr(p), chr(q - 1)))
+        
+        other = signatures.pop(frozenset(), None)
+        
+        classes = sorted(signatures.items(), key=lambda item: item[1][0])
+        
+        alphabet = cls(CharClass(ranges) if len(ranges) > 1 or ranges[0][0] != ranges[0][1] else ranges[0][0] for signature, ranges in classes)
+        alphabet.members = [[label for label in labels if label in signature] for signature, ranges in classes]
+        alphabet.covers = {label: [] for label in labels}
+        alphabet.other = CharClass(other) if other else None
+        
+        for c, members in enumerate(alphabet.members):
+            for label in members:
+                alphabet.covers[label].append(c)
+        
+        return alphabet
+    
+    
+    def search(self, code):
+        i = bisect_right(self.starts, code) - 1
+        
+        return self.ids[i] if i >= 0 and code <= self.ends[i] else self.k
+    
+    
+    def classify(self, char):
+        code = ord(char)
+        
+        return self.byte_map[code] if code < 256 else self.search(code)
+    
+    
+    def get(self, char, default=None):
+        c = self.classify(char)
+        
+        return c if c != self.k else default
+    
+    
+    def __getitem__(self, char):
+        c = self.classify(char)
+        
+        if c == self.k:
+            raise KeyError(char)
+        
+        return c
+    
+    
+    def __contains__(self, char):
+        return self.classify(char) != self.k
+    
+    
+    def __len__(self):
+        return self.k
+
+
+
+
+def share(node, side):
+    # a parent with the same set as its child points at the child's set, or at the child itself
+    value = getattr(node, side)
+    
+    return value if value is not None else node
+
+
+def union_mask(node, side):
+    # resolves a lazy firstpos/lastpos: ints are ORed, leaf positions are set in one linear pass
+    mask = 0
+    positions = []
+    stack = [node]
+    
+    while stack:
+        current = stack.pop()
+        value = getattr(current, side)
+        
+        if value is None:
+            stack.append(current.left)
+            stack.append(current.right)
+        elif isinstance(value, int):
+            mask |= value
+        elif value.pos is not None:
+            positions.append(value.pos)
+        else:
+            stack.append(value)
+    
+    if positions:
+        bits = bytearray(max(positions) // 8 + 1)
+        
+        for pos in positions:
+            bits[pos >> 3] |= 1 << (pos & 7)
+        
+        mask |= int.from_bytes(bits, 'little')
+    
+    return mask
+
+
+def to_bitset(positions):
+    mask = 0
+    
+    for pos in positions:
+        mask |= 1 << pos
+        
+    return mask
+
+
+def from_bitset(mask):
+    positions = []
+    
+    while mask:
+        low = mask & -mask
+        positions.append(low.bit_length() - 1)
+        mask ^= low
+        
+    return positions
+
+
+
+
+class TraceRecorder(object):
+    """
+    CLASS TRACE RECORDER
+    
+    Sink que guarda los eventos de traza en una lista, sin referencias a los
+    autómatas para no retenerlos en memoria.
+    
+    Params:
+        None
+    """
+    def __init__(self):
+        self.events = []
+        
+        
+    def emit(self, event):
+        event = dict(event)
+        event.pop('automata', None)
+        
+        self.events.append(event)
+
+
+
+
+class ColorPrinter(object):
+    """
+    CLASS COLOR PRINTER
+    
+    Sink que imprime los eventos de construcción con colores en la consola,
+    igual que lo hacía el programa antes de tener trazas.
+    
+    Params:
+        None
+    """
+    def emit(self, event):
+        operation = event['operation']
+        
+        if operation == 'clean':
+            print(Colors.OKBLUE + "[INFO] " + Colors.ENDC + "Cleaning and refactoring postfix")
+            
+        elif operation == 'postfix':
+            print(Colors.OKBLUE + "[INFO] " + Colors.ENDC + "Transforming regex to postfix")
+            print(Colors.OKBLUE + "[INFO] " + Colors.ENDC + "Postfix obtained: " + event['postfix'])
+            
+        elif operation == 'build':
+            print(Colors.OKBLUE + "[INFO] " + Colors.ENDC + "Building tree")
+            
+        elif operation == 'followpos':
+            print(event['followpos'])
+            
+        elif 'automata' in event:
+            a = event['automata']
+            a.print_automata(operation, a.initial_state, a.terminal_states, a.states, a.symbols, a.transition_function, state_mapping=getattr(a, 'state_mapping', None))
+
+
+
+
+class Profile(object):
+    """
+    CLASS PROFILE
+    
+    Sink que acumula el tiempo de cada fase (llamadas y segundos por fase y
+    operación) y los contadores del camino crítico: llamadas a la ε-cerradura y a
+    move, estados visitados, transiciones tomadas y aciertos de caché. Puede
+    reenviar los eventos a otro sink.
+    
+    Params:
+        -> sink (object): sink al que se reenvían los eventos, o None
+    """
+    def __init__(self, sink=None):
+        self.sink = sink
+        self.phases = {}
+        self.counters = {}
+        self.adopted = []
+    
+    
+    def adopt(self, obj):
+        self.adopted.append(weakref.ref(obj))
+    
+    
+    def detach(self):
+        # objects created inside the block stop reporting once it is over
+        for ref in self.adopted:
+            obj = ref()
+            
+            if obj is not None and obj.sink is self:
+                obj.sink = None
+        
+        self.adopted = []
+    
+    
+    def emit(self, event):
+        if event['operation'] == 'counters':
+            for name, value in event['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+        
+        elif event['elapsed'] is not None:
+            key = event['phase'] + '.' + event['operation']
+            calls, elapsed = self.phases.get(key, (0, 0.0))
+            self.phases[key] = (calls + 1, elapsed + event['elapsed'])
+        
+        self.sink is not None and self.sink.emit(event)
+    
+    
+    def report(self):
+        return {
+            'phases': {key: {'calls': calls, 'seconds': elapsed} for key, (calls, elapsed) in self.phases.items()},
+            'counters': dict(self.counters),
+        }
+
+
+
+
+@contextmanager
+def profile(*objects, sink=None):
+    """
+    Captura el perfil de una compilación o de una simulación. Los árboles y
+    autómatas creados dentro del bloque, y los objetos dados, reportan al perfil
+    solo mientras dura el bloque.
+    
+    Params:
+        -> objects (Traceable): objetos ya construidos a perfilar
+        -> sink (object): sink al que se reenvían los eventos, o None
+    """
+    recorder = Profile(sink)
+    token = ACTIVE_SINK.set(recorder)
+    previous = [obj.sink for obj in objects]
+    
+    for obj in objects:
+        obj.sink = recorder
+    
+    try:
+        yield recorder
+    finally:
+        ACTIVE_SINK.reset(token)
+        recorder.detach()
+        
+        for obj, old in zip(objects, previous):
+            obj.sink = old
 
 
 